@@ -2,30 +2,42 @@ import json
 import os
 import sys
 import time
-from multiprocessing import Pool
 from pathlib import Path
 import shutil
 
-from genetics.classes import JsonReference, RandomMainAgentFactory, JsonMainAgentStateAdapter, \
-    ClosePositionMainAgentFactory
+from genetics.classes import openReference, RandomMainAgentFactory, JsonMainAgentStateAdapter, \
+    ClosePositionMainAgentFactory, NpzMainAgentStateAdapter, RunLogMainAgentStateAdapter
 from genetics.noise_algorithm.algorithm import NoiseAlgorithm
 from genetics.noise_algorithm.crosser import NoiseCrosser
 from genetics.noise_algorithm.fitness_function import NoiseFitnessFunction
 from genetics.noise_algorithm.mutator import NoiseMutator
+from genetics.shared_memory import SharedMemoryExecutor
+from genetics.background_writer import BackgroundStateAdapter
+from genetics.checkpoint import Checkpoint
 
 main_directory = Path(__file__).resolve().parent
 outPath = f"{main_directory}/__out"
 
 def main():
     if len(sys.argv) < 2:
-        print("Usage: python genetic_algorithm.py [filename] [prefix]")
+        print("Usage: python genetic_algorithm.py [filename] [prefix] [--resume __out_<timestamp>]")
         sys.exit(1)
 
-    dirName = str(sys.argv[1])
+    arguments = sys.argv[1:]
+    resumeDirName = None
+    if "--resume" in arguments:
+        position = arguments.index("--resume")
+        if position + 1 >= len(arguments):
+            print("Missing the run directory after --resume")
+            sys.exit(1)
+        resumeDirName = arguments[position + 1]
+        del arguments[position:position + 2]
+
+    dirName = str(arguments[0])
     prefix = ''
 
-    if len(sys.argv) >= 3:
-        prefix = str(sys.argv[2])
+    if len(arguments) >= 2:
+        prefix = str(arguments[1])
 
     directoryPath = Path(f"{outPath}/{dirName}")
 
@@ -33,29 +45,43 @@ def main():
         print(f"Not a directory {outPath}/{dirName}")
         sys.exit(1)
 
-    runForOne(directoryPath, dirName, prefix)
+    runForOne(directoryPath, dirName, prefix, resumeDirName)
 
 
-def runForOne(directoryPath: Path, dirName: str, prefix: str):
-    referencePath = f"{directoryPath}/reference.json"
+def runForOne(directoryPath: Path, dirName: str, prefix: str, resumeDirName: str = None):
     configPath = f"{directoryPath}/config.json"
     stateFilesDir = f"{directoryPath}/{prefix}__out_{int(time.time())}"
+    checkpoint = None
 
-    if not os.path.exists(referencePath) or not os.path.isfile(referencePath):
-        print(f"File does not exist {referencePath}")
-        sys.exit(1)
+    if resumeDirName is not None:
+        stateFilesDir = f"{directoryPath}/{resumeDirName}"
+        checkpointPath = getCheckpointPath(stateFilesDir)
+
+        if not os.path.isfile(checkpointPath):
+            print(f"File does not exist {checkpointPath}")
+            sys.exit(1)
 
-    if not os.path.exists(configPath) or not os.path.isfile(configPath):
-        print(f"File does not exist {configPath}")
+        checkpoint = Checkpoint.load(checkpointPath)
+
+    reference = openReference(str(directoryPath))
+    if reference is None:
+        print(f"File does not exist {directoryPath}/reference.npy nor {directoryPath}/reference.json")
         sys.exit(1)
 
-    if not os.path.exists(stateFilesDir) or not os.path.isfile(stateFilesDir):
-        os.makedirs(stateFilesDir)
+    if checkpoint is not None:
+        # The run continues with the configuration it was started with
+        config = checkpoint.getConfig()
+    else:
+        if not os.path.exists(configPath) or not os.path.isfile(configPath):
+            print(f"File does not exist {configPath}")
+            sys.exit(1)
+
+        if not os.path.exists(stateFilesDir) or not os.path.isfile(stateFilesDir):
+            os.makedirs(stateFilesDir)
 
-    shutil.copyfile(configPath, f"{stateFilesDir}/config.json")
-    config = readConfig(configPath)
+        shutil.copyfile(configPath, f"{stateFilesDir}/config.json")
+        config = readConfig(configPath)
 
-    reference = JsonReference(referencePath)
     agentFactory = ClosePositionMainAgentFactory(
         reference.xMax(),
         reference.yMax(),
@@ -67,16 +93,46 @@ def runForOne(directoryPath: Path, dirName: str, prefix: str):
         config["numberOfInterpolationPoints"],
         config["startingPositionRadius"]
     )
-    stateAdapter = JsonMainAgentStateAdapter(stateFilesDir, dirName)
+    stateFormat = config.get("stateFormat", "json")
+    compressed = config.get("stateCompression", True)
+    if stateFormat == "npz":
+        stateAdapter = NpzMainAgentStateAdapter(stateFilesDir, dirName, compressed=compressed)
+    elif stateFormat == "log":
+        stateAdapter = RunLogMainAgentStateAdapter(stateFilesDir, dirName, compressed=compressed,
+                                                   keyframeInterval=config.get("keyframeInterval", 1))
+    else:
+        stateAdapter = JsonMainAgentStateAdapter(stateFilesDir, dirName)
+
+    if config.get("backgroundSaving", False):
+        stateAdapter = BackgroundStateAdapter(stateAdapter, config.get("saveQueueSize", 4))
     crosser = NoiseCrosser(config["crossoverChance"], config["crossoverPoints"])
     mutator = NoiseMutator(config["mutationChance"], config["significantAlleles"])
 
-    algorithm = NoiseAlgorithm(reference, stateAdapter, crosser, mutator, agentFactory, config, Pool(processes=12))
-    algorithm.addFitnessFunction(NoiseFitnessFunction(), 1)
-    start = time.time()
-    algorithm.run()
-    print(f"time: {time.time() - start}")
-    algorithm.save()
+    processes = config.get("processes", 12)
+    executor = SharedMemoryExecutor(processes, config.get("curveCacheSize", 8192)) if processes > 1 else None
+
+    try:
+        algorithm = NoiseAlgorithm(reference, stateAdapter, crosser, mutator, agentFactory, config, executor,
+                                   getCheckpointPath(stateFilesDir))
+        algorithm.addFitnessFunction(NoiseFitnessFunction(), 1)
+        if checkpoint is not None:
+            algorithm.resume(checkpoint)
+            print(f"resumed at generation {algorithm.getGeneration()}")
+        start = time.time()
+        algorithm.run()
+        print(f"time: {time.time() - start}")
+        algorithm.save()
+    finally:
+        # Queued snapshots are written before the process ends
+        if isinstance(stateAdapter, BackgroundStateAdapter):
+            stateAdapter.close()
+
+        if executor is not None:
+            executor.close()
+
+
+def getCheckpointPath(stateFilesDir: str) -> str:
+    return f"{stateFilesDir}/checkpoint/checkpoint.npz"
 
 
 def readConfig(configPath: str) -> {}:
@@ -0,0 +1,118 @@
+import atexit
+import queue
+import threading
+import time
+from collections import deque
+from typing import List
+
+import numpy as np
+
+from genetics.basics import AlgorithmStateAdapter, Agent
+
+
+class BackgroundStateAdapter(AlgorithmStateAdapter):
+    """
+    Wraps a state adapter and saves through a writer thread. save returns as soon as the snapshot is queued
+    and blocks only while the queue is full. A failed write is raised by the next save, flush or close.
+    Snapshots must not change after they are handed over, see MainAgentPopulation.freeze.
+    """
+    __adapter: AlgorithmStateAdapter
+    __queue: queue.Queue
+    __thread: threading.Thread
+    __handedOver: deque
+    __error: BaseException | None = None
+    __closed: bool = False
+    __lastWriteTime: float = 0
+
+    def __init__(self, adapter: AlgorithmStateAdapter, maxQueueSize: int = 4):
+        self.__adapter = adapter
+        self.__queue = queue.Queue(maxsize=max(1, maxQueueSize))
+        self.__handedOver = deque()
+        self.__thread = threading.Thread(target=self.__write, name="BackgroundStateAdapter", daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    def setState(self, state: List[Agent]) -> None:
+        self.flush()
+        self.__adapter.setState(state)
+
+    def hasState(self) -> bool:
+        self.flush()
+        return self.__adapter.hasState()
+
+    def load(self, index: int = None) -> List[Agent]:
+        self.flush()
+        return self.__adapter.load(index)
+
+    def save(self, data: List[Agent], generation: int = None) -> None:
+        if self.__closed:
+            raise RuntimeError("BackgroundStateAdapter is closed.")
+
+        self.__raiseError()
+        self.__handedOver.append(time.time())
+        self.__queue.put((data, generation))
+
+    def saveHistogram(self, counts: np.ndarray, minimum: float, maximum: float) -> None:
+        # Histograms are a single line, they are written right away
+        self.__adapter.saveHistogram(counts, minimum, maximum)
+
+    def getSavePoint(self) -> {}:
+        self.flush()
+        return self.__adapter.getSavePoint()
+
+    def rollback(self, savePoint: {}) -> None:
+        self.flush()
+        self.__adapter.rollback(savePoint)
+
+    def flush(self) -> None:
+        """Wait until every queued snapshot is written"""
+        self.__queue.join()
+        self.__raiseError()
+
+    def close(self) -> None:
+        if self.__closed:
+            return
+
+        self.__closed = True
+        self.__queue.put(None)
+        self.__thread.join()
+        atexit.unregister(self.close)
+        self.__raiseError()
+
+    def getQueueDepth(self) -> int:
+        """Snapshots handed over and not written yet, including the one being written"""
+        return len(self.__handedOver)
+
+    def getLag(self) -> float:
+        """Seconds since the oldest snapshot which is not written yet was handed over"""
+        try:
+            return time.time() - self.__handedOver[0]
+        except IndexError:
+            return 0
+
+    def getLastWriteTime(self) -> float:
+        """Seconds the writer spent on the last snapshot"""
+        return self.__lastWriteTime
+
+    def __write(self) -> None:
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                self.__queue.task_done()
+                return
+
+            start = time.time()
+            try:
+                self.__adapter.save(*item)
+            except BaseException as e:
+                if self.__error is None:
+                    self.__error = e
+            finally:
+                self.__lastWriteTime = time.time() - start
+                self.__handedOver.popleft()
+                self.__queue.task_done()
+
+    def __raiseError(self) -> None:
+        error, self.__error = self.__error, None
+        if error is not None:
+            raise error
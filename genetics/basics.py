@@ -1,6 +1,10 @@
+import math
+import random
 from abc import ABC, abstractmethod
 from typing import List
 
+import numpy as np
+
 
 class Point:
     __x: int
@@ -17,11 +21,26 @@ class Point:
         return self.__y
 
 
+def createSummedAreaTable(values: np.ndarray) -> np.ndarray:
+    """Integral image with a leading row and column of zeros: table[y, x] is the sum of values[:y, :x]"""
+    summedAreaTable = np.zeros((values.shape[0] + 1, values.shape[1] + 1), dtype=np.float64)
+    np.cumsum(np.cumsum(values, axis=0, dtype=np.float64), axis=1, out=summedAreaTable[1:, 1:])
+
+    return summedAreaTable
+
+
 class Agent(ABC):
     @abstractmethod
     def getPointForT(self, t: float) -> Point:
         pass
 
+    def getPoints(self) -> np.ndarray:
+        """All sampled points of the agent as an (n, 2) array of rounded (x, y) coordinates, by default one by one"""
+        step = self.getStep()
+        points = [self.getPointForT(t) for t in np.arange(0, 1 + step, step)]
+
+        return np.array([[point.getX(), point.getY()] for point in points], dtype=np.int64).reshape(-1, 2)
+
     @abstractmethod
     def getStep(self) -> float:
         pass
@@ -82,10 +101,28 @@ class Reference(ABC):
     def getValueOnPoint(self, point: Point, threshold: int = 0) -> int | float:
         pass
 
+    def getValuesOnPoints(self, xs: np.ndarray, ys: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        """Vectorized getValueOnPoint; thresholds are broadcast against the coordinates, by default point by point"""
+        xs, ys, thresholds = np.broadcast_arrays(xs, ys, thresholds)
+        values = [self.getValueOnPoint(Point(x, y), int(threshold))
+                  for x, y, threshold in zip(xs.ravel(), ys.ravel(), thresholds.ravel())]
+
+        return np.array(values, dtype=float).reshape(xs.shape)
+
     @abstractmethod
     def setValueOnPoint(self, value: int | float, point: Point) -> None:
         pass
 
+    def getValues(self) -> np.ndarray:
+        """Reference values indexed as [y, x], by default read point by point"""
+        ys, xs = np.mgrid[0:self.yMax() + 1, 0:self.xMax() + 1]
+
+        return self.getValuesOnPoints(xs, ys, np.zeros_like(xs))
+
+    def getSummedAreaTable(self) -> np.ndarray:
+        """Integral image of getValues() padded with a leading zero row and column"""
+        return createSummedAreaTable(self.getValues())
+
     @abstractmethod
     def xMax(self) -> int:
         pass
@@ -106,6 +143,14 @@ class Crosser(ABC):
     def checkIfRun(self, agents: List[Agent]) -> bool:
         pass
 
+    def crossoverPopulation(self, agents: List[Agent]) -> None:
+        """Cross over random pairs of the population, by default pair by pair"""
+        divider = 2
+        for x in range(math.floor(len(agents) / divider)):
+            pair = random.sample(agents, divider)
+            if self.checkIfRun(pair):
+                self.crossover(pair)
+
 
 class Mutator(ABC):
     @abstractmethod
@@ -117,12 +162,38 @@ class Mutator(ABC):
     def checkIfMutateAgentBit(self, agent: Agent) -> bool:
         pass
 
+    def mutatePopulation(self, agents: List[Agent]) -> None:
+        """Mutate all agents at once, by default agent by agent"""
+        for agent in agents:
+            self.mutate(agent)
+
 
 class FitnessFunction(ABC):
     @abstractmethod
     def evaluate(self, agent: Agent, reference: Reference) -> float:
         pass
 
+    def isZeroOutside(self) -> bool:
+        """True when every curve with a sample outside the reference scores 0, batches then skip those curves"""
+        return False
+
+    def evaluateBatch(self, agents: List[Agent], points: np.ndarray, reference: Reference,
+                      inside: np.ndarray = None) -> np.ndarray:
+        """
+        Evaluate a whole population given its sampled points of shape (agents, samples, 2).
+        inside optionally marks agents whose samples are known to lie inside the reference.
+        """
+        return np.array([self.evaluate(agent, reference) for agent in agents], dtype=float)
+
+    def evaluateNative(self, agents: List[Agent], reference: Reference, inside: np.ndarray = None) -> np.ndarray | None:
+        """Evaluate a whole population with a native kernel, None when there is none for this function"""
+        return None
+
+    def evaluatePixels(self, agents: List[Agent], pixels: np.ndarray, offsets: np.ndarray,
+                       reference: Reference, inside: np.ndarray = None) -> np.ndarray:
+        """Evaluate a whole population given the pixels visited by each curve, see sampleAgentsAdaptive"""
+        raise NotImplementedError(f"{type(self).__name__} does not support adaptive sampling.")
+
 
 class AlgorithmStateAdapter(ABC):
     @abstractmethod
@@ -138,7 +209,20 @@ class AlgorithmStateAdapter(ABC):
         pass
 
     @abstractmethod
-    def save(self, data: List[Agent]) -> None:
+    def save(self, data: List[Agent], generation: int = None) -> None:
+        """Save a snapshot, generation is the generation of the algorithm it was taken in when known"""
+        pass
+
+    def saveHistogram(self, counts: np.ndarray, minimum: float, maximum: float) -> None:
+        """Store the evaluation histogram of the population at the last save, ignored by default"""
+        pass
+
+    def getSavePoint(self) -> {}:
+        """JSON-serializable description of everything saved so far, see rollback"""
+        return {}
+
+    def rollback(self, savePoint: {}) -> None:
+        """Drop the snapshots and histograms saved after getSavePoint returned savePoint, ignored by default"""
         pass
 
 
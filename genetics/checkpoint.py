@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+from typing import Dict
+
+import numpy as np
+
+
+class Checkpoint:
+    """
+    Arrays and a JSON header written to a single .npz file. Saving writes a temporary file next to the
+    target, syncs it and renames it over the target, so the file on disk is always a complete checkpoint.
+    """
+    FORMAT = "genetics.Checkpoint"
+    VERSION = 1
+
+    __header: {}
+    __arrays: Dict[str, np.ndarray]
+
+    def __init__(self, header: {}, arrays: Dict[str, np.ndarray]):
+        self.__header = header
+        self.__arrays = arrays
+
+    @classmethod
+    def load(cls, path: str) -> "Checkpoint":
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {name: archive[name] for name in archive.files}
+
+        header = json.loads(str(arrays.pop("header")))
+        if header.get("format") != cls.FORMAT or header.get("version", 0) > cls.VERSION:
+            raise ValueError(f"Unsupported checkpoint '{path}': {header.get('format')}, "
+                             f"version {header.get('version')}.")
+
+        return Checkpoint(header, arrays)
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        header = json.dumps({**self.__header, "format": self.FORMAT, "version": self.VERSION})
+
+        fd, temporaryPath = tempfile.mkstemp(dir=directory, suffix='.npz')
+        try:
+            with os.fdopen(fd, 'wb') as checkpointFile:
+                np.savez(checkpointFile, header=np.array(header), **self.__arrays)
+                checkpointFile.flush()
+                os.fsync(checkpointFile.fileno())
+            os.replace(temporaryPath, path)
+        except BaseException:
+            os.remove(temporaryPath)
+            raise
+
+    def getHeader(self) -> {}:
+        return self.__header
+
+    def getArray(self, name: str) -> np.ndarray:
+        return self.__arrays[name]
+
+    def getGeneration(self) -> int:
+        """The generation a resumed run starts with"""
+        return self.__header["generation"]
+
+    def getConfig(self) -> {}:
+        return self.__header["config"]
+
+    def getSnapshots(self) -> int:
+        """How many snapshots the run had saved when the checkpoint was taken"""
+        return self.__header["snapshots"]
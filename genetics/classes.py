@@ -1,3 +1,4 @@
+import io
 import json
 import math
 import os
@@ -5,12 +6,16 @@ import random
 import time
 import uuid
 from abc import ABC
-from typing import List
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
 from textwrap import wrap
 
 from Cython.Shadow import _ArrayType
 
-from genetics.basics import Agent, Point, AlgorithmStateAdapter, Crosser, Mutator, AgentFactory, Reference
+from genetics.basics import Agent, Point, AlgorithmStateAdapter, Crosser, Mutator, AgentFactory, Reference, \
+    createSummedAreaTable
+from genetics.run_log import RunLog
 import ctypes
 import numpy as np
 
@@ -19,17 +24,497 @@ interpolate_function = interpolateLib.interpolate
 interpolate_function.argtypes = [ctypes.c_double, ctypes.POINTER(ctypes.c_double), ctypes.c_int]
 interpolate_function.restype = ctypes.POINTER(ctypes.c_double)
 
+# Batch kernel, libraries compiled before it was added only export interpolate
+evaluate_curves_function = getattr(interpolateLib, 'evaluateCurves', None)
+if evaluate_curves_function is not None:
+    _doubles = np.ctypeslib.ndpointer(dtype=np.float64, flags='C_CONTIGUOUS')
+    _longs = np.ctypeslib.ndpointer(dtype=np.int64, flags='C_CONTIGUOUS')
+    _bytes = np.ctypeslib.ndpointer(dtype=np.uint8, flags='C_CONTIGUOUS')
+    evaluate_curves_function.argtypes = [_doubles, _longs, ctypes.c_longlong, _doubles, _longs, _doubles,
+                                         ctypes.c_int, _doubles, _doubles, ctypes.c_int, ctypes.c_int, ctypes.c_int,
+                                         ctypes.c_int, _longs, _bytes, _doubles, _bytes]
+    evaluate_curves_function.restype = None
+
+# The same kernel reading a uint8 reference in place, libraries compiled before it fall back to float values
+evaluate_scaled_curves_function = getattr(interpolateLib, 'evaluateCurvesScaled', None)
+if evaluate_scaled_curves_function is not None:
+    evaluate_scaled_curves_function.argtypes = [_doubles, _longs, ctypes.c_longlong, _doubles, _longs, _doubles,
+                                                ctypes.c_int, _bytes, ctypes.c_double, _doubles, ctypes.c_int,
+                                                ctypes.c_int, ctypes.c_int, ctypes.c_int, _longs, _bytes, _doubles,
+                                                _bytes]
+    evaluate_scaled_curves_function.restype = None
+
+set_number_of_threads_function = getattr(interpolateLib, 'setNumberOfThreads', None)
+
+
+@lru_cache(maxsize=None)
+def _getInterpolationTs(numberOfInterpolationPoints: int) -> np.ndarray:
+    step = 1 / numberOfInterpolationPoints
+    ts = np.arange(0, 1 + step, step)
+    ts.setflags(write=False)
+
+    return ts
+
+
+@lru_cache(maxsize=None)
+def _getBernsteinBasis(size: int, numberOfInterpolationPoints: int) -> np.ndarray:
+    """Bernstein basis of shape (len(ts), size). Orders 1-3 use the exact coefficient formulas of interpolate.cpp."""
+    order = size - 1
+    t = _getInterpolationTs(numberOfInterpolationPoints)
+    mt = 1 - t
+
+    if order == 0:
+        columns = [np.ones_like(t)]
+    elif order == 1:
+        columns = [mt, t]
+    elif order == 2:
+        columns = [mt * mt, mt * t * 2, t * t]
+    elif order == 3:
+        mt2, t2 = mt * mt, t * t
+        columns = [mt2 * mt, mt2 * t * 3, mt * t2 * 3, t * t2]
+    else:
+        columns = [math.comb(order, i) * np.power(t, i) * np.power(mt, order - i) for i in range(size)]
+
+    basis = np.stack(columns, axis=1)
+    basis.setflags(write=False)
+
+    return basis
+
+
+def _resolveRoundingTies(samples: np.ndarray, points: np.ndarray, ts: np.ndarray) -> None:
+    """
+    Bernstein and de Casteljau evaluation differ by a few ulps, which only matters where a sample lies on
+    a .5 rounding boundary. Recompute those samples with the de Casteljau scheme of interpolate.cpp.
+    """
+    distance = np.abs(samples - np.floor(samples) - 0.5)
+    curveIndices, tIndices = np.nonzero((distance <= 1e-7 * np.maximum(1, np.abs(samples))).any(axis=2))
+
+    for curveIndex, tIndex in zip(curveIndices, tIndices):
+        t = float(ts[tIndex])
+        dCpts = points[curveIndex].tolist()
+        while len(dCpts) > 1:
+            dCpts = [[a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t] for a, b in zip(dCpts, dCpts[1:])]
+        samples[curveIndex, tIndex] = dCpts[0]
+
+
+def _interpolateGroup(points: np.ndarray, numberOfInterpolationPoints: int) -> np.ndarray:
+    """Sample curves sharing the same number of control points, points has shape (curves, size, 2)"""
+    size = points.shape[1]
+    basis = _getBernsteinBasis(size, numberOfInterpolationPoints)
+    # Accumulate column by column to keep the summation order of interpolate.cpp
+    samples = basis[None, :, 0, None] * points[:, None, 0, :]
+    for i in range(1, size):
+        samples = samples + basis[None, :, i, None] * points[:, None, i, :]
+
+    if size > 4:
+        _resolveRoundingTies(samples, points, _getInterpolationTs(numberOfInterpolationPoints))
+
+    # Mutated high bits can produce coordinates beyond int64, clip them (they are out of bounds anyway)
+    return np.clip(np.rint(samples), -2 ** 62, 2 ** 62).astype(np.int64)
+
+
+def interpolateCurves(controlPoints: List[np.ndarray], numberOfInterpolationPoints: int) -> np.ndarray:
+    """Sample many curves at once. Returns rounded points of shape (len(controlPoints), len(ts), 2)."""
+    numberOfTs = len(_getInterpolationTs(numberOfInterpolationPoints))
+    result = np.empty((len(controlPoints), numberOfTs, 2), dtype=np.int64)
+    indicesBySize = {}
+
+    for index, points in enumerate(controlPoints):
+        indicesBySize.setdefault(len(points), []).append(index)
+
+    for size, indices in indicesBySize.items():
+        result[indices] = _interpolateGroup(np.stack([controlPoints[index] for index in indices]),
+                                            numberOfInterpolationPoints)
+
+    return result
+
+
+def interpolateAgents(agents: List["MainAgent"]) -> np.ndarray:
+    """Sample every agent's curve in one call. All agents must share numberOfInterpolationPoints."""
+    numbersOfInterpolationPoints = {agent.getNumberOfInterpolationPoints() for agent in agents}
+
+    if len(numbersOfInterpolationPoints) > 1:
+        raise ValueError("All agents must share the same numberOfInterpolationPoints.")
+
+    numberOfInterpolationPoints = numbersOfInterpolationPoints.pop() if agents else 1
+    backing = MainAgentPopulation.findBackingPopulation(agents)
+
+    if backing is not None:
+        population, indices = backing
+        return population.interpolate(indices, numberOfInterpolationPoints)
+
+    return interpolateCurves([agent.getControlPoints() for agent in agents], numberOfInterpolationPoints)
+
+
+def getAdaptiveNumberOfInterpolationPoints(controlPoints: np.ndarray, limit: int) -> int:
+    """Power of two number of steps close to the control polygon length, which bounds the curve length"""
+    polygonLength = float(np.sum(np.hypot(*np.diff(controlPoints, axis=0).T))) if len(controlPoints) > 1 else 0
+
+    return 1 << max(0, math.ceil(math.log2(max(min(polygonLength, float(limit)), 1))))
+
+
+def _uniquePixels(samples: np.ndarray) -> np.ndarray:
+    """Keep the first visit of every pixel of each curve, samples has shape (curves, samples, 2)"""
+    curves, numberOfTs = samples.shape[:2]
+    # Pack (curve, x, y) into one key, pixels far outside of any reference collapse together
+    bound = 1 << 20
+    coordinates = np.clip(samples, -bound, bound - 1) + bound
+    keys = ((np.arange(curves, dtype=np.int64)[:, None] << 21 | coordinates[:, :, 0]) << 21) | coordinates[:, :, 1]
+    keys = keys.ravel()
+
+    # Consecutive samples mostly fall on the same pixel, drop those before sorting the rest
+    candidates = np.ones(len(keys), dtype=bool)
+    candidates[1:] = keys[1:] != keys[:-1]
+    positions = np.nonzero(candidates)[0]
+    order = positions[np.argsort(keys[positions], kind='stable')]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = keys[order][1:] != keys[order][:-1]
+
+    keep = np.zeros(len(keys), dtype=bool)
+    keep[order[first]] = True
+
+    return keep.reshape(curves, numberOfTs)
+
+
+def hasNativeEvaluation() -> bool:
+    return evaluate_curves_function is not None
+
+
+def setNativeThreads(threads: int) -> None:
+    """Number of OpenMP threads used by evaluateCurvesNative in this process"""
+    if set_number_of_threads_function is not None:
+        set_number_of_threads_function(ctypes.c_int(threads))
+
+
+def _getFlatControlPoints(agents: List["MainAgent"]) -> Tuple[np.ndarray, np.ndarray]:
+    """Control points of all agents as one (total, 2) array and offsets of shape (len(agents) + 1)"""
+    backing = MainAgentPopulation.findBackingPopulation(agents)
+    if backing is None:
+        controlPoints = [agent.getControlPoints() for agent in agents]
+    else:
+        population, indices = backing
+        lengths = population.getLengths()[indices]
+        coordinates = population.getCoordinates()
+        controlPoints = [None] * len(agents)
+        for length in np.unique(lengths):
+            group = np.nonzero(lengths == length)[0]
+            for position, points in zip(group, _wordsToControlPoints(coordinates[indices[group], :length])):
+                controlPoints[position] = points
+
+    offsets = np.zeros(len(agents) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(points) for points in controlPoints])
+    points = np.concatenate(controlPoints) if agents else np.empty((0, 2))
+
+    return np.ascontiguousarray(points, dtype=np.float64), offsets
+
+
+def evaluateCurvesNative(agents: List["MainAgent"], reference: Reference,
+                         inside: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample the curves, check their bounds and sum the reference values on the samples in the native library,
+    in parallel and without the GIL. Returns the sums and whether every sample lay inside the reference.
+    """
+    if evaluate_curves_function is None:
+        raise RuntimeError("interpolate.so does not export evaluateCurves, recompile it or check "
+                           "hasNativeEvaluation() first.")
+
+    numbersOfInterpolationPoints = {agent.getNumberOfInterpolationPoints() for agent in agents}
+    if len(numbersOfInterpolationPoints) > 1:
+        raise ValueError("All agents must share the same numberOfInterpolationPoints.")
+
+    numberOfInterpolationPoints = numbersOfInterpolationPoints.pop() if agents else 1
+    ts = np.ascontiguousarray(_getInterpolationTs(numberOfInterpolationPoints))
+    points, offsets = _getFlatControlPoints(agents)
+
+    # Bases of every curve size present, the same matrices _interpolateGroup uses
+    sizes = np.unique(np.diff(offsets))
+    basisOffsets = np.zeros(int(sizes.max(initial=0)) + 1, dtype=np.int64)
+    bases = [_getBernsteinBasis(int(size), numberOfInterpolationPoints).ravel() for size in sizes]
+    basisOffsets[sizes] = np.cumsum([0] + [len(basis) for basis in bases[:-1]])
+    bases = np.ascontiguousarray(np.concatenate(bases) if bases else np.zeros(1))
+    summedAreaTable = np.ascontiguousarray(reference.getSummedAreaTable(), dtype=np.float64)
+    thresholds = np.array([agent.getThreshold() for agent in agents], dtype=np.int64)
+    inside = np.zeros(len(agents), dtype=np.uint8) if inside is None else inside.astype(np.uint8)
+
+    coverage = np.zeros(len(agents))
+    inBounds = np.zeros(len(agents), dtype=np.uint8)
+    # A uint8 reference is read from its memory-mapped file, no process decodes it to floats
+    if evaluate_scaled_curves_function is not None and isinstance(reference, NpyReference) \
+            and reference.getStoredValues().dtype == np.uint8:
+        storedValues = np.ascontiguousarray(reference.getStoredValues())
+        evaluate_scaled_curves_function(points, offsets, len(agents), bases, basisOffsets, ts, len(ts), storedValues,
+                                        reference.getScale(), summedAreaTable, storedValues.shape[1],
+                                        storedValues.shape[0], reference.xMax(), reference.yMax(), thresholds, inside,
+                                        coverage, inBounds)
+    else:
+        values = np.ascontiguousarray(reference.getValues(), dtype=np.float64)
+        evaluate_curves_function(points, offsets, len(agents), bases, basisOffsets, ts, len(ts), values,
+                                 summedAreaTable, values.shape[1], values.shape[0], reference.xMax(), reference.yMax(),
+                                 thresholds, inside, coverage, inBounds)
+
+    return coverage, inBounds.astype(bool)
+
+
+def getSamplingLimit(reference: Reference) -> int:
+    """Cap on adaptive steps per curve, a curve lying inside the reference rarely gets longer"""
+    return 2 * (reference.xMax() + reference.yMax())
+
+
+def sampleAgentsAdaptive(agents: List["MainAgent"], limit: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sample every curve densely enough to reach each pixel it passes through and visit each of them once.
+    Curves whose consecutive samples are more than one pixel apart are sampled again with twice the steps.
+    Returns pixels of shape (total, 2) in order along the curves and offsets of shape (len(agents) + 1),
+    pixels of agents[i] are pixels[offsets[i]:offsets[i + 1]]. limit caps the number of steps per curve.
+    """
+    numbers = np.array([getAdaptiveNumberOfInterpolationPoints(agent.getControlPoints(), limit) for agent in agents],
+                       dtype=np.int64)
+    backing = MainAgentPopulation.findBackingPopulation(agents)
+    pixelsByAgent: List[np.ndarray] = [np.empty((0, 2), dtype=np.int64)] * len(agents)
+    pending = np.arange(len(agents))
+
+    while len(pending) > 0:
+        refined = []
+        for numberOfInterpolationPoints in np.unique(numbers[pending]):
+            group = pending[numbers[pending] == numberOfInterpolationPoints]
+            if backing is not None:
+                population, indices = backing
+                samples = population.interpolate(indices[group], int(numberOfInterpolationPoints))
+            else:
+                samples = interpolateCurves([agents[position].getControlPoints() for position in group],
+                                            int(numberOfInterpolationPoints))
+
+            gaps = (np.abs(np.diff(samples, axis=1)) > 1).any(axis=(1, 2))
+            if numberOfInterpolationPoints < limit:
+                refined.append(group[gaps])
+                group, samples = group[~gaps], samples[~gaps]
+
+            keep = _uniquePixels(samples)
+            for row, position in enumerate(group):
+                pixelsByAgent[position] = samples[row][keep[row]]
+
+        pending = np.concatenate(refined) if refined else np.empty(0, dtype=np.int64)
+        numbers[pending] *= 2
+
+    offsets = np.zeros(len(agents) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(pixels) for pixels in pixelsByAgent])
+    pixels = np.concatenate(pixelsByAgent) if agents else np.empty((0, 2), dtype=np.int64)
+
+    return pixels, offsets
+
+
+class CurveCache:
+    """Bounded LRU cache of sampled curves keyed by genome and numberOfInterpolationPoints"""
+    __maxSize: int
+    __entries: OrderedDict
+    __hits: int = 0
+    __misses: int = 0
+
+    def __init__(self, maxSize: int = 8192):
+        self.__maxSize = maxSize
+        self.__entries = OrderedDict()
+
+    def get(self, key: Tuple) -> np.ndarray | None:
+        points = self.__entries.get(key)
+
+        if points is None:
+            self.__misses += 1
+        else:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+
+        return points
+
+    def put(self, key: Tuple, points: np.ndarray) -> None:
+        if self.__maxSize <= 0:
+            return
+
+        points.setflags(write=False)
+        self.__entries[key] = points
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.__maxSize:
+            self.__entries.popitem(last=False)
+
+    def setMaxSize(self, maxSize: int) -> None:
+        self.__maxSize = maxSize
+        while len(self.__entries) > max(maxSize, 0):
+            self.__entries.popitem(last=False)
+
+    def getHits(self) -> int:
+        return self.__hits
+
+    def getMisses(self) -> int:
+        return self.__misses
+
+    def getSize(self) -> int:
+        return len(self.__entries)
+
+    def resetCounters(self) -> None:
+        self.__hits = 0
+        self.__misses = 0
+
+
+curveCache = CurveCache()
+
+BOUNDS_OUTSIDE = -1
+BOUNDS_AMBIGUOUS = 0
+BOUNDS_INSIDE = 1
+
+
+class BoundsFilterCounters:
+    """Number of curves classified by classifyAgentBounds since the last reset"""
+    __counts: np.ndarray
+
+    def __init__(self):
+        self.__counts = np.zeros(3, dtype=np.int64)
+
+    def add(self, bounds: np.ndarray) -> None:
+        self.__counts += np.bincount(bounds - BOUNDS_OUTSIDE, minlength=3)
+
+    def getOutside(self) -> int:
+        return int(self.__counts[BOUNDS_OUTSIDE - BOUNDS_OUTSIDE])
+
+    def getAmbiguous(self) -> int:
+        return int(self.__counts[BOUNDS_AMBIGUOUS - BOUNDS_OUTSIDE])
+
+    def getInside(self) -> int:
+        return int(self.__counts[BOUNDS_INSIDE - BOUNDS_OUTSIDE])
+
+    def resetCounters(self) -> None:
+        self.__counts[:] = 0
+
+
+boundsFilterCounters = BoundsFilterCounters()
+
+
+def classifyAgentBounds(agents: List["MainAgent"], xMax: int, yMax: int,
+                        numberOfInterpolationPoints: int = None) -> np.ndarray:
+    """
+    Classify curves against the region 0 < x < xMax, 0 < y < yMax from their control points alone.
+    A Bezier curve lies in the convex hull of its control points, so a hull inside the region keeps every
+    sample inside (BOUNDS_INSIDE), as long as no sampled t exceeds 1. The start point is always sampled, and
+    so is the end point when the sampled ts contain 1 exactly, a start or end point outside the region means
+    a sample outside (BOUNDS_OUTSIDE). numberOfInterpolationPoints None stands for adaptive sampling.
+    """
+    withinHull, endSampled = True, True
+    if numberOfInterpolationPoints is not None:
+        # Rounding in np.arange can leave out t = 1 or add a t slightly above 1
+        ts = _getInterpolationTs(numberOfInterpolationPoints)
+        withinHull, endSampled = bool(ts[-1] <= 1), bool((ts == 1).any())
+    backing = MainAgentPopulation.findBackingPopulation(agents)
+
+    if backing is not None:
+        population, indices = backing
+        lengths = population.getLengths()[indices]
+        coordinates = population.getCoordinates()[indices]
+        numbersOfPoints = lengths // 2
+        valid = np.arange(coordinates.shape[1] // 2)[None, :] < numbersOfPoints[:, None]
+        xs, ys = coordinates[:, 0:2 * valid.shape[1]:2], coordinates[:, 1:2 * valid.shape[1]:2]
+        # Genome layout is start, end, inner points, a single point curve ends where it starts
+        endColumn = np.minimum(numbersOfPoints, 2) - 1
+        starts = np.stack((xs[:, 0], ys[:, 0]), axis=1)
+        ends = np.stack((xs[np.arange(len(indices)), endColumn], ys[np.arange(len(indices)), endColumn]), axis=1)
+        minimums = np.stack((np.where(valid, xs, np.inf).min(axis=1), np.where(valid, ys, np.inf).min(axis=1)), 1)
+        maximums = np.stack((np.where(valid, xs, -np.inf).max(axis=1), np.where(valid, ys, -np.inf).max(axis=1)), 1)
+    else:
+        controlPoints = [agent.getControlPoints() for agent in agents]
+        starts = np.array([points[0] for points in controlPoints]).reshape(-1, 2)
+        ends = np.array([points[-1] for points in controlPoints]).reshape(-1, 2)
+        minimums = np.array([points.min(axis=0) for points in controlPoints]).reshape(-1, 2)
+        maximums = np.array([points.max(axis=0) for points in controlPoints]).reshape(-1, 2)
+
+    limits = np.array([xMax, yMax])
+    bounds = np.full(len(agents), BOUNDS_AMBIGUOUS, dtype=np.int64)
+    if withinHull:
+        bounds[((minimums >= 1) & (maximums <= limits - 1)).all(axis=1)] = BOUNDS_INSIDE
+
+    outside = ~((starts > 0) & (starts < limits)).all(axis=1)
+    if endSampled:
+        outside |= ~((ends > 0) & (ends < limits)).all(axis=1)
+    bounds[outside] = BOUNDS_OUTSIDE
+
+    return bounds
+
+
+class FitnessCache:
+    """
+    Bounded LRU cache of raw (not normalized) evaluation values keyed by genome, threshold,
+    numberOfInterpolationPoints and reference
+    """
+    __maxSize: int
+    __entries: OrderedDict
+
+    def __init__(self, maxSize: int = 65536):
+        self.__maxSize = maxSize
+        self.__entries = OrderedDict()
+
+    @staticmethod
+    def createKey(agent: Agent, referenceId: int) -> Tuple:
+        if isinstance(agent, MainAgent):
+            population = agent.getPopulation()
+            index = agent.getIndex()
+            alleles = int(population.getLengths()[index])
+            genome = population.getGenes()[index, :alleles].tobytes()
+        else:
+            genome = agent.getGeneticRepresentation()
+
+        return genome, agent.getThreshold(), round(1 / agent.getStep()), referenceId
+
+    def get(self, key: Tuple) -> float | None:
+        value = self.__entries.get(key)
+        if value is not None:
+            self.__entries.move_to_end(key)
+
+        return value
+
+    def put(self, key: Tuple, value: float) -> None:
+        if self.__maxSize <= 0:
+            return
+
+        self.__entries[key] = value
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.__maxSize:
+            self.__entries.popitem(last=False)
+
+    def setMaxSize(self, maxSize: int) -> None:
+        self.__maxSize = maxSize
+        while len(self.__entries) > max(maxSize, 0):
+            self.__entries.popitem(last=False)
+
+    def getSize(self) -> int:
+        return len(self.__entries)
+
+    def clear(self) -> None:
+        self.__entries.clear()
+
+
+def _wordsToControlPoints(coordinates: np.ndarray) -> np.ndarray:
+    """Arrange decoded genomes of shape (..., alleles) into control points of shape (..., points, 2)"""
+    alleles = coordinates.shape[-1] - coordinates.shape[-1] % 2
+    coordinates = coordinates[..., :alleles].astype(np.float64).reshape(coordinates.shape[:-1] + (-1, 2))
+    # Genome layout is start, end, inner points while the curve runs start, inner points, end
+    return np.concatenate((coordinates[..., :1, :], coordinates[..., 2:, :], coordinates[..., 1:2, :]), axis=-2)
+
 
 class _BezierCurve:
     __cPoints: ctypes.Array
     __points: List[List[int | int]]
     __pointsSize: int
+    __controlPoints: np.ndarray = None
 
     def __init__(self, start: [int | int], end: [int | int], innerRawPoints: List[List[int | int]]):
         self.__points = [start] + innerRawPoints + [end]
         self.__cPoints = self.__convertPointsToCDouble(self.__points)
         self.__pointsSize = len(self.__points)
 
+    def getControlPoints(self) -> np.ndarray:
+        if self.__controlPoints is None:
+            self.__controlPoints = np.array(self.__points, dtype=np.float64).reshape(self.__pointsSize, 2)
+
+        return self.__controlPoints
+
     def __convertPointsToCDouble(self, points: List[List[int | int]]) -> ctypes.Array:
         return (ctypes.c_double * (2 * len(points)))(*[item for sublist in points for item in sublist])
 
@@ -43,6 +528,13 @@ class _BezierCurve:
 
         return _BezierCurve(start, end, points)
 
+    @classmethod
+    def fromWords(cls, words: np.ndarray) -> "_BezierCurve":
+        values = [int(word) for word in words]
+        points = [[x, y] for x, y in zip(values[4::2], values[5::2])]
+
+        return _BezierCurve(values[0:2], values[2:4], points)
+
     def interpolateForT(self, t) -> Point:
         if t == 0:
             return Point(self.__points[0][0], self.__points[0][1])
@@ -57,90 +549,418 @@ class _BezierCurve:
 
         return Point(result[0], result[1])
 
+    def interpolateAll(self, numberOfInterpolationPoints: int) -> np.ndarray:
+        return interpolateCurves([self.getControlPoints()], numberOfInterpolationPoints)[0]
+
+
+class MainAgentPopulation:
+    """
+    Array-backed store of MainAgent genomes. Every allele is packed into one uint64 word and every agent
+    owns one row of the genes matrix, rows are ragged through the lengths vector (alleles per agent).
+    MainAgent objects are lightweight views over a row.
+
+    Decoded coordinates are kept alongside the genes, writes mark the alleles they touch as dirty and only
+    those are decoded again.
+    """
+    __genes: np.ndarray
+    __coordinates: np.ndarray
+    __dirty: np.ndarray
+    __lengths: np.ndarray
+    __thresholds: np.ndarray
+    __interpolationPoints: np.ndarray
+    __evaluations: np.ndarray
+    __versions: np.ndarray
+    __alleleLength: int
+
+    def __init__(self, size: int, capacity: int, alleleLength: int = 64):
+        self.__checkAlleleLength(alleleLength)
+        self.__genes = np.zeros((size, capacity), dtype=np.uint64)
+        self.__coordinates = np.zeros((size, capacity), dtype=np.float64)
+        self.__dirty = np.zeros((size, capacity), dtype=bool)
+        self.__lengths = np.zeros(size, dtype=np.int64)
+        self.__thresholds = np.ones(size, dtype=np.int64)
+        self.__interpolationPoints = np.ones(size, dtype=np.int64)
+        self.__evaluations = np.zeros(size, dtype=np.float64)
+        self.__versions = np.zeros(size, dtype=np.int64)
+        self.__alleleLength = alleleLength
+
+    @classmethod
+    def fromArrays(cls, genes: np.ndarray, lengths: np.ndarray, thresholds: np.ndarray,
+                   interpolationPoints: np.ndarray, evaluations: np.ndarray,
+                   alleleLength: int) -> "MainAgentPopulation":
+        population = MainAgentPopulation(0, 0, alleleLength)
+        population.__genes = genes
+        population.__coordinates = np.zeros(genes.shape, dtype=np.float64)
+        population.__dirty = np.ones(genes.shape, dtype=bool)
+        population.__lengths = lengths
+        population.__thresholds = thresholds
+        population.__interpolationPoints = interpolationPoints
+        population.__evaluations = evaluations
+        population.__versions = np.zeros(len(lengths), dtype=np.int64)
+
+        return population
+
+    @classmethod
+    def fromPackedGenes(cls, packedGenes: np.ndarray, lengths: np.ndarray, thresholds: np.ndarray,
+                        interpolationPoints: np.ndarray, evaluations: np.ndarray,
+                        alleleLength: int) -> "MainAgentPopulation":
+        """Inverse of getPackedGenes, lengths are given in alleles"""
+        cls.__checkAlleleLength(alleleLength)
+        size, capacity = len(lengths), int(np.max(lengths, initial=0))
+
+        if alleleLength == 64:
+            words = np.ascontiguousarray(packedGenes[:, :capacity * 8])
+        else:
+            # Left pad every allele to a whole big-endian word
+            bits = np.zeros((size, capacity, 64), dtype=np.uint8)
+            bits[:, :, 64 - alleleLength:] = np.unpackbits(packedGenes, axis=1, count=capacity * alleleLength).reshape(
+                size, capacity, alleleLength)
+            words = np.packbits(bits, axis=2)
+
+        return MainAgentPopulation.fromArrays(
+            words.view('>u8').reshape(size, capacity).astype(np.uint64), np.asarray(lengths, dtype=np.int64),
+            np.asarray(thresholds, dtype=np.int64), np.asarray(interpolationPoints, dtype=np.int64),
+            np.asarray(evaluations, dtype=np.float64), alleleLength
+        )
+
+    @classmethod
+    def fromGeneticRepresentations(cls, geneticRepresentations: List[str], thresholds: List[int],
+                                   interpolationPoints: List[int], evaluations: List[float],
+                                   alleleLength: int) -> "MainAgentPopulation":
+        words = [cls.__encode(genetic, alleleLength) for genetic in geneticRepresentations]
+        population = MainAgentPopulation(len(words), max((len(row) for row in words), default=0), alleleLength)
+
+        for index, row in enumerate(words):
+            population.__genes[index, :len(row)] = row
+            population.__lengths[index] = len(row)
+
+        population.__dirty[:] = True
+
+        population.__thresholds[:] = thresholds
+        population.__interpolationPoints[:] = interpolationPoints
+        population.__evaluations[:] = evaluations
+
+        return population
+
+    @classmethod
+    def fromAgents(cls, agents: List[Agent]) -> "MainAgentPopulation":
+        """Copy agents into a new population, rows follow the order of the list"""
+        alleleLengths = {agent.getAlleleLength() for agent in agents}
+        if len(alleleLengths) > 1:
+            raise ValueError("All agents of a population must share the same alleleLength.")
+
+        alleleLength = alleleLengths.pop() if agents else 64
+        backing = cls.findBackingPopulation(agents)
+
+        if backing is not None:
+            source, indices = backing
+            capacity = int(source.__lengths[indices].max(initial=0))
+            return MainAgentPopulation.fromArrays(
+                source.__genes[indices, :capacity], source.__lengths[indices], source.__thresholds[indices],
+                source.__interpolationPoints[indices], source.__evaluations[indices], alleleLength
+            )
+
+        return cls.fromGeneticRepresentations(
+            [agent.getGeneticRepresentation() for agent in agents],
+            [agent.getThreshold() for agent in agents],
+            [round(1 / agent.getStep()) for agent in agents],
+            [agent.getEvaluationValue() for agent in agents],
+            alleleLength
+        )
+
+    @classmethod
+    def findBackingPopulation(cls, agents: List[Agent]) -> Tuple["MainAgentPopulation", np.ndarray] | None:
+        """Return the population and row indices when all agents are views over the same population"""
+        if not agents or not all(isinstance(agent, MainAgent) for agent in agents):
+            return None
+
+        population = agents[0].getPopulation()
+        if any(agent.getPopulation() is not population for agent in agents):
+            return None
+
+        return population, np.fromiter((agent.getIndex() for agent in agents), dtype=np.int64, count=len(agents))
+
+    def getAgents(self) -> List["MainAgent"]:
+        return [MainAgent.fromPopulation(self, index) for index in range(self.getSize())]
+
+    def getSize(self) -> int:
+        return len(self.__lengths)
+
+    def getCapacity(self) -> int:
+        return self.__genes.shape[1]
+
+    def getAlleleLength(self) -> int:
+        return self.__alleleLength
+
+    def getGenes(self) -> np.ndarray:
+        return self.__genes
+
+    def getLengths(self) -> np.ndarray:
+        return self.__lengths
+
+    def getThresholds(self) -> np.ndarray:
+        return self.__thresholds
+
+    def getInterpolationPoints(self) -> np.ndarray:
+        return self.__interpolationPoints
+
+    def getEvaluations(self) -> np.ndarray:
+        return self.__evaluations
+
+    def getVersions(self) -> np.ndarray:
+        return self.__versions
+
+    def getNbytes(self) -> int:
+        """Bytes held by the store, decoded coordinates and dirty flags included"""
+        return sum(array.nbytes for array in (self.__genes, self.__coordinates, self.__dirty, self.__lengths,
+                                              self.__thresholds, self.__interpolationPoints, self.__evaluations,
+                                              self.__versions))
+
+    def freeze(self) -> None:
+        """Make genes, lengths, thresholds, interpolation points and evaluations read-only"""
+        for array in (self.__genes, self.__lengths, self.__thresholds, self.__interpolationPoints,
+                      self.__evaluations):
+            array.setflags(write=False)
+
+    def getPackedGenes(self) -> np.ndarray:
+        """
+        Genomes as bits, alleleLength bits per allele, packed eight to a byte. Row i holds
+        lengths[i] * alleleLength meaningful bits, the remainder of each row is zero.
+        """
+        capacity = int(self.__lengths.max(initial=0))
+        words = np.ascontiguousarray(self.__genes[:, :capacity], dtype='>u8').view(np.uint8)
+
+        if self.__alleleLength == 64:
+            return words.reshape(self.getSize(), capacity * 8)
+
+        bits = np.unpackbits(words.reshape(self.getSize(), capacity, 8), axis=2)[:, :, 64 - self.__alleleLength:]
+
+        return np.packbits(bits.reshape(self.getSize(), capacity * self.__alleleLength), axis=1)
+
+    def setGenes(self, genes: np.ndarray, lengths: np.ndarray, indices: np.ndarray = None) -> None:
+        """Replace the genomes of the given rows (all rows by default) with a (rows, alleles) matrix"""
+        if indices is None:
+            indices = np.arange(self.getSize())
+
+        self.__ensureCapacity(genes.shape[1])
+        width = genes.shape[1]
+        changed = self.__genes[indices, :width] != genes
+        changedTail = self.__genes[indices, width:] != 0
+        # Zero alleles gained or lost change the curve without changing any word
+        resized = self.__lengths[indices] != lengths
+
+        self.__genes[indices, :width] = genes
+        self.__genes[indices, width:] = 0
+        self.__lengths[indices] = lengths
+
+        rows, alleles = np.nonzero(np.concatenate((changed, changedTail), axis=1))
+        self.markChanged(np.asarray(indices)[rows], alleles)
+        self.markChanged(np.asarray(indices)[resized])
+
+    def markChanged(self, indices: np.ndarray, alleles: np.ndarray = None) -> None:
+        """
+        Mark genes changed in place. With alleles given, (indices[i], alleles[i]) pairs are marked,
+        otherwise the whole rows. Versions of the rows are bumped, which invalidates decoded curves.
+        """
+        if alleles is None:
+            self.__dirty[indices] = True
+        else:
+            self.__dirty[indices, alleles] = True
+
+        np.add.at(self.__versions, np.unique(indices), 1)
+
+    def getCoordinates(self) -> np.ndarray:
+        """Decoded genes as float64, only alleles changed since the last call are decoded"""
+        if self.__dirty.any():
+            self.__coordinates[self.__dirty] = self.__genes[self.__dirty]
+            self.__dirty[:] = False
+
+        return self.__coordinates
+
+    def getWords(self, index: int) -> np.ndarray:
+        return self.__genes[index, :self.__lengths[index]]
+
+    def getGeneticRepresentation(self, index: int) -> str:
+        alleleFormat = f"0{self.__alleleLength}b"
+
+        return ''.join(format(int(word), alleleFormat) for word in self.getWords(index))
+
+    def setGeneticRepresentation(self, index: int, geneticRepresentation: str) -> None:
+        words = self.__encode(geneticRepresentation, self.__alleleLength)
+        self.setGenes(np.array([words], dtype=np.uint64).reshape(1, len(words)), np.array([len(words)]),
+                      np.array([index]))
+
+    def getControlPoints(self, index: int) -> np.ndarray:
+        return _wordsToControlPoints(self.getCoordinates()[index, :self.__lengths[index]])
+
+    def interpolate(self, indices: np.ndarray, numberOfInterpolationPoints: int) -> np.ndarray:
+        """Sample the curves of the given rows, returns rounded points of shape (len(indices), len(ts), 2)"""
+        numberOfTs = len(_getInterpolationTs(numberOfInterpolationPoints))
+        result = np.empty((len(indices), numberOfTs, 2), dtype=np.int64)
+        lengths = self.__lengths[indices]
+        keys = [(numberOfInterpolationPoints, self.__genes[index, :length].tobytes())
+                for index, length in zip(indices, lengths)]
+        missing = []
+
+        for position, key in enumerate(keys):
+            points = curveCache.get(key)
+            if points is None:
+                missing.append(position)
+            else:
+                result[position] = points
+
+        missing = np.array(missing, dtype=np.int64)
+        coordinates = self.getCoordinates()
+
+        for length in np.unique(lengths[missing]):
+            group = missing[lengths[missing] == length]
+            points = _wordsToControlPoints(coordinates[indices[group], :length])
+            result[group] = _interpolateGroup(points, numberOfInterpolationPoints)
+
+            for position in group:
+                curveCache.put(keys[position], result[position].copy())
+
+        return result
+
+    def __ensureCapacity(self, capacity: int) -> None:
+        if capacity > self.getCapacity():
+            genes = np.zeros((self.getSize(), capacity), dtype=np.uint64)
+            genes[:, :self.getCapacity()] = self.__genes
+            coordinates = np.zeros((self.getSize(), capacity), dtype=np.float64)
+            coordinates[:, :self.getCapacity()] = self.__coordinates
+            dirty = np.zeros((self.getSize(), capacity), dtype=bool)
+            dirty[:, :self.getCapacity()] = self.__dirty
+            self.__genes, self.__coordinates, self.__dirty = genes, coordinates, dirty
+
+    @staticmethod
+    def __checkAlleleLength(alleleLength: int) -> None:
+        if not 0 < alleleLength <= 64:
+            raise ValueError("Alleles are packed into 64-bit words, alleleLength must be between 1 and 64.")
+
+    @staticmethod
+    def __encode(geneticRepresentation: str, alleleLength: int) -> List[int]:
+        if len(geneticRepresentation) % alleleLength != 0:
+            raise ValueError("Genetic representation length must be a multiple of alleleLength.")
+
+        return [int(geneticRepresentation[i:i + alleleLength], 2)
+                for i in range(0, len(geneticRepresentation), alleleLength)]
+
 
 class MainAgent(Agent):
-    __eval: float
-    __geneticRepresentation: str
-    __alleleLength: int
-    __threshold: int
-    __numberOfInterpolationPoints: int
+    __population: MainAgentPopulation
+    __index: int
     __innerCurve: _BezierCurve
-    __innerCurveDirty = False
+    __innerCurveVersion: int = -1
     __step: float = None
 
     def __init__(self, numberOfInterpolationPoints: int, threshold: int = 1, alleleLength: int = 64,
                  geneticRepresentation: str = ''):
-        self.__numberOfInterpolationPoints = numberOfInterpolationPoints
-        self.__alleleLength = alleleLength
-        self.__threshold = threshold
-        self.setGeneticRepresentation(geneticRepresentation)
+        self.__population = MainAgentPopulation.fromGeneticRepresentations(
+            [geneticRepresentation], [threshold], [numberOfInterpolationPoints], [0.0], alleleLength
+        )
+        self.__index = 0
+
+    @classmethod
+    def fromPopulation(cls, population: MainAgentPopulation, index: int) -> "MainAgent":
+        agent = cls.__new__(cls)
+        agent.__population = population
+        agent.__index = index
+
+        return agent
+
+    def getPopulation(self) -> MainAgentPopulation:
+        return self.__population
+
+    def getIndex(self) -> int:
+        return self.__index
 
     def getPointForT(self, t: float) -> Point:
-        if self.__innerCurveDirty:
-            self.__updateInnerCurve()
+        return self.__getInnerCurve().interpolateForT(t)
 
-        return self.__innerCurve.interpolateForT(t)
+    def getPoints(self) -> np.ndarray:
+        return self.__population.interpolate(np.array([self.__index]), self.getNumberOfInterpolationPoints())[0]
 
-    def __updateInnerCurve(self):
-        self.__innerCurve = _BezierCurve.fromGeneticRepresentation(
-            self.__geneticRepresentation,
-            self.__alleleLength
-        )
-        self.__innerCurveDirty = False
+    def getControlPoints(self) -> np.ndarray:
+        return self.__population.getControlPoints(self.__index)
+
+    def getNumberOfInterpolationPoints(self) -> int:
+        return int(self.__population.getInterpolationPoints()[self.__index])
+
+    def __getInnerCurve(self) -> _BezierCurve:
+        version = self.__population.getVersions()[self.__index]
+        if self.__innerCurveVersion != version:
+            self.__innerCurve = _BezierCurve.fromWords(self.__population.getWords(self.__index))
+            self.__innerCurveVersion = version
+
+        return self.__innerCurve
 
     def getStep(self) -> float:
         if self.__step is None:
-            self.__step = 1 / self.__numberOfInterpolationPoints
+            self.__step = 1 / self.getNumberOfInterpolationPoints()
 
         return self.__step
 
     def setStep(self, step: float) -> None:
         self.__step = step
-        self.__numberOfInterpolationPoints = round(1 / step)
+        self.__population.getInterpolationPoints()[self.__index] = round(1 / step)
 
     def getThreshold(self) -> int:
-        return self.__threshold
+        return int(self.__population.getThresholds()[self.__index])
 
     def getEvaluationValue(self) -> float:
-        return self.__eval
+        return float(self.__population.getEvaluations()[self.__index])
 
     def setEvaluationValue(self, value: float) -> None:
-        self.__eval = value
+        self.__population.getEvaluations()[self.__index] = value
 
     def getGeneticRepresentation(self) -> str:
-        return self.__geneticRepresentation
+        return self.__population.getGeneticRepresentation(self.__index)
 
     def setGeneticRepresentation(self, geneticRepresentation: str) -> None:
-        self.__geneticRepresentation = geneticRepresentation
-        self.__innerCurveDirty = True
+        self.__population.setGeneticRepresentation(self.__index, geneticRepresentation)
 
     def getLength(self) -> int:
-        return len(self.__geneticRepresentation)
+        return int(self.__population.getLengths()[self.__index]) * self.getAlleleLength()
 
     def clone(self) -> "Agent":
-        agent = MainAgent(self.__numberOfInterpolationPoints, self.__threshold, self.__alleleLength,
-                          self.__geneticRepresentation)
-        agent.setEvaluationValue(self.__eval)
+        agent = MainAgent.fromPopulation(MainAgentPopulation.fromAgents([self]), 0)
+        agent.__step = self.__step
 
         return agent
 
     def getAlleleLength(self) -> int:
-        return self.__alleleLength
+        return self.__population.getAlleleLength()
 
     def setAlleleLength(self, length: int) -> None:
-        self.__alleleLength = length
+        # A population shares one allele length, the agent is detached into its own population
+        self.__population = MainAgentPopulation.fromGeneticRepresentations(
+            [self.getGeneticRepresentation()], [self.getThreshold()], [self.getNumberOfInterpolationPoints()],
+            [self.getEvaluationValue()], length
+        )
+        self.__index = 0
+        self.__innerCurveVersion = -1
+
+    def __getstate__(self):
+        # Pickle the agent detached from its population, the decoded curve holds a ctypes array
+        return {
+            "_MainAgent__population": MainAgentPopulation.fromAgents([self]),
+            "_MainAgent__index": 0,
+            "_MainAgent__step": self.__step,
+        }
 
     def toDictionary(self) -> {}:
         return {
-            "e": self.__eval,
-            "g": self.__geneticRepresentation,
-            "a": int(self.__alleleLength),
-            "t": int(self.__threshold),
-            "n": int(self.__numberOfInterpolationPoints),
+            "e": self.getEvaluationValue(),
+            "g": self.getGeneticRepresentation(),
+            "a": int(self.getAlleleLength()),
+            "t": int(self.getThreshold()),
+            "n": int(self.getNumberOfInterpolationPoints()),
         }
 
 
 class _JsonAgentStateAdapter(AlgorithmStateAdapter, ABC):
+    HISTOGRAM_FILE = "histograms.csv"
+
     _state: List[Agent] = None
     _filePrefix: str
     _dir: str
@@ -157,6 +977,50 @@ class _JsonAgentStateAdapter(AlgorithmStateAdapter, ABC):
     def hasState(self) -> bool:
         return self._state is not None
 
+    def saveHistogram(self, counts: np.ndarray, minimum: float, maximum: float) -> None:
+        """One line per save: agents, evaluation range and the counts of equal-width bins over it"""
+        with open(os.path.join(self._dir, self.HISTOGRAM_FILE), 'a') as histogramFile:
+            histogramFile.write(f"{int(np.sum(counts))},{minimum!r},{maximum!r},{','.join(map(str, counts))}\n")
+
+    def getSavePoint(self) -> {}:
+        return {
+            "snapshotFiles": [os.path.basename(path) for path in self.__getOwnStateFileNames()],
+            "histograms": self._getHistogramCount(),
+        }
+
+    def rollback(self, savePoint: {}) -> None:
+        if "snapshotFiles" in savePoint:
+            kept = set(savePoint["snapshotFiles"])
+            for path in self.__getOwnStateFileNames():
+                if os.path.basename(path) not in kept:
+                    os.remove(path)
+
+        if "histograms" in savePoint:
+            self._truncateHistograms(savePoint["histograms"])
+
+    def _getHistogramCount(self) -> int:
+        try:
+            with open(os.path.join(self._dir, self.HISTOGRAM_FILE), 'r') as histogramFile:
+                return sum(1 for _ in histogramFile)
+        except FileNotFoundError:
+            return 0
+
+    def _truncateHistograms(self, count: int) -> None:
+        """Keep the first count lines of the histogram file"""
+        path = os.path.join(self._dir, self.HISTOGRAM_FILE)
+        if not os.path.isfile(path):
+            return
+
+        with open(path, 'r') as histogramFile:
+            lines = histogramFile.readlines()[:count]
+        with open(path, 'w') as histogramFile:
+            histogramFile.writelines(lines)
+
+    def __getOwnStateFileNames(self) -> List[str]:
+        # Other files of the directory, like rendered images, are never touched
+        return [path for path in self._getStateFileNames() or []
+                if os.path.basename(path).startswith(f"{self._filePrefix}_")]
+
     def _getStateFileContent(self, path: str) -> List:
         try:
             with open(path, 'r') as jsonFile:
@@ -174,7 +1038,7 @@ class _JsonAgentStateAdapter(AlgorithmStateAdapter, ABC):
         if not files:
             return None
 
-        files = filter(lambda x: x != 'config.json' and x != '.DS_Store', files)
+        files = filter(lambda x: x not in ('config.json', '.DS_Store', self.HISTOGRAM_FILE), files)
 
         return sorted([os.path.join(self._dir, f) for f in files])
 
@@ -196,6 +1060,8 @@ class _JsonAgentStateAdapter(AlgorithmStateAdapter, ABC):
 
 
 class JsonMainAgentStateAdapter(_JsonAgentStateAdapter):
+    SNAPSHOT_FIELDS = ("n", "t", "a", "g", "e", "agents")
+
     def load(self, index: int = None) -> List[Agent]:
         agents: List[Agent] = []
         latestFileName = None
@@ -213,28 +1079,86 @@ class JsonMainAgentStateAdapter(_JsonAgentStateAdapter):
         if latestFileName is None:
             return agents
 
-        stateRawList = self._getStateFileContent(latestFileName)
+        return self._loadStateFile(latestFileName)
+
+    def _loadStateFile(self, path: str) -> List[Agent]:
+        stateRawList = self._getStateFileContent(path)
 
         if stateRawList is None:
-            return agents
+            return []
 
-        # Legacy mode
-        if self._legacy:
-            for rawAgentData in stateRawList:
-                agent = MainAgent(rawAgentData["numberOfInterpolationPoints"], rawAgentData["threshold"],
-                                  rawAgentData["alleleLength"], rawAgentData["geneticRepresentation"])
-                agent.setEvaluationValue(rawAgentData["eval"])
-                agents.append(agent)
-        else:
+        return self._createAgents(stateRawList, *self._getKeys(stateRawList))
+
+    def readSnapshots(self, fields: Tuple[str, ...] = ("e",), minEvaluation: float = None,
+                      start: int = 0) -> Iterator[Dict]:
+        """
+        Yield the snapshots from index start on, one at a time, as dictionaries of the requested fields keyed
+        like toDictionary, "agents" for MainAgents and "index". Agents below minEvaluation are dropped before
+        the other fields are read and no genome is decoded unless "g" or "agents" is requested.
+        """
+        fields = self._checkSnapshotFields(fields)
+
+        for index, path in enumerate((self._getStateFileNames() or [])[start:], start):
+            snapshot = self._readSnapshotFile(path, fields, minEvaluation)
+            snapshot["index"] = index
+            yield snapshot
+
+    def _readSnapshotFile(self, path: str, fields: Tuple[str, ...], minEvaluation: float | None) -> Dict:
+        stateRawList = self._getStateFileContent(path) or []
+        keys = self._getKeys(stateRawList)
+
+        if minEvaluation is not None:
+            stateRawList = [rawAgentData for rawAgentData in stateRawList if rawAgentData[keys[4]] >= minEvaluation]
+
+        snapshot = {}
+        for field, key, dtype in zip(("n", "t", "a", "g", "e"), keys, (np.int64, np.int64, np.int64, None, float)):
+            if field in fields:
+                values = [rawAgentData[key] for rawAgentData in stateRawList]
+                snapshot[field] = values if dtype is None else np.array(values, dtype=dtype)
+
+        if "agents" in fields:
+            snapshot["agents"] = self._createAgents(stateRawList, *keys)
+
+        return snapshot
+
+    def _checkSnapshotFields(self, fields: Tuple[str, ...]) -> Tuple[str, ...]:
+        unknown = set(fields) - set(self.SNAPSHOT_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown snapshot fields {sorted(unknown)}, expected {self.SNAPSHOT_FIELDS}.")
+
+        return tuple(fields)
+
+    def _getKeys(self, stateRawList: List) -> List[str]:
+        # Legacy mode, files with the long keys are recognised without the flag as well
+        if self._legacy or (stateRawList and "geneticRepresentation" in stateRawList[0]):
+            return ["numberOfInterpolationPoints", "threshold", "alleleLength", "geneticRepresentation", "eval"]
+
+        return ["n", "t", "a", "g", "e"]
+
+    def _createAgents(self, stateRawList: List, interpolationKey: str, thresholdKey: str, alleleKey: str,
+                      geneticKey: str, evalKey: str) -> List[Agent]:
+        alleleLengths = {rawAgentData[alleleKey] for rawAgentData in stateRawList}
+
+        # Agents of one snapshot share a packed population unless their allele lengths differ
+        if len(alleleLengths) != 1:
+            agents = []
             for rawAgentData in stateRawList:
-                agent = MainAgent(rawAgentData["n"], rawAgentData["t"],
-                                  rawAgentData["a"], rawAgentData["g"])
-                agent.setEvaluationValue(rawAgentData["e"])
+                agent = MainAgent(rawAgentData[interpolationKey], rawAgentData[thresholdKey],
+                                  rawAgentData[alleleKey], rawAgentData[geneticKey])
+                agent.setEvaluationValue(rawAgentData[evalKey])
                 agents.append(agent)
 
-        return agents
+            return agents
+
+        return MainAgentPopulation.fromGeneticRepresentations(
+            [rawAgentData[geneticKey] for rawAgentData in stateRawList],
+            [rawAgentData[thresholdKey] for rawAgentData in stateRawList],
+            [rawAgentData[interpolationKey] for rawAgentData in stateRawList],
+            [rawAgentData[evalKey] for rawAgentData in stateRawList],
+            alleleLengths.pop()
+        ).getAgents()
 
-    def save(self, data: List[Agent]) -> None:
+    def save(self, data: List[Agent], generation: int = None) -> None:
         self.setState(data)
         agentsData = [agent.toDictionary() for agent in self._state]
 
@@ -242,6 +1166,322 @@ class JsonMainAgentStateAdapter(_JsonAgentStateAdapter):
             json.dump(agentsData, jsonFile, indent=2)
 
 
+class NpzMainAgentStateAdapter(JsonMainAgentStateAdapter):
+    """
+    Saves snapshots as numpy archives of typed arrays with bit-packed genomes. Loading recognises the
+    archives by their zip signature and reads JSON snapshots, short and long keyed, like its parent.
+    """
+    FORMAT = "genetics.MainAgentPopulation"
+    VERSION = 1
+
+    __compressed: bool
+
+    def __init__(self, directory: str, prefix: str, legacy: bool = False, compressed: bool = True):
+        super().__init__(directory, prefix, legacy)
+        self.__compressed = compressed
+
+    def save(self, data: List[Agent], generation: int = None) -> None:
+        self.setState(data)
+
+        with open(f"{self._dir}/{self._createNewStateFileName()}.npz", 'wb') as npzFile:
+            self._writeArchive(npzFile, self._state)
+
+    def _loadStateFile(self, path: str) -> List[Agent]:
+        with open(path, 'rb') as stateFile:
+            signature = stateFile.read(4)
+
+        if signature != b'PK\x03\x04':
+            return super()._loadStateFile(path)
+
+        return self._readArchive(path, path)
+
+    def _readSnapshotFile(self, path: str, fields: Tuple[str, ...], minEvaluation: float | None) -> Dict:
+        with open(path, 'rb') as stateFile:
+            signature = stateFile.read(4)
+
+        if signature != b'PK\x03\x04':
+            return super()._readSnapshotFile(path, fields, minEvaluation)
+
+        with np.load(path, allow_pickle=False) as arrays:
+            return self._projectArchive(arrays, path, fields, minEvaluation)
+
+    def _writeArchive(self, file, agents: List[Agent]) -> None:
+        population = MainAgentPopulation.fromAgents(agents)
+        header = json.dumps({"format": self.FORMAT, "version": self.VERSION})
+
+        self._saveArrays(file, header=np.array(header), genes=population.getPackedGenes(),
+                         lengths=population.getLengths().astype(np.int32),
+                         thresholds=population.getThresholds().astype(np.int32),
+                         interpolationPoints=population.getInterpolationPoints().astype(np.int32),
+                         evaluations=population.getEvaluations(), alleleLength=np.array(population.getAlleleLength()))
+
+    def _saveArrays(self, file, **arrays: np.ndarray) -> None:
+        write = np.savez_compressed if self.__compressed else np.savez
+        write(file, **arrays)
+
+    def _readArchive(self, file, name: str) -> List[Agent]:
+        with np.load(file, allow_pickle=False) as arrays:
+            self._checkArchiveHeader(arrays, name)
+
+            return MainAgentPopulation.fromPackedGenes(
+                arrays["genes"], arrays["lengths"], arrays["thresholds"], arrays["interpolationPoints"],
+                arrays["evaluations"], int(arrays["alleleLength"])
+            ).getAgents()
+
+    def _projectArchive(self, arrays, name: str, fields: Tuple[str, ...], minEvaluation: float | None) -> Dict:
+        """Snapshot dictionary of readSnapshots, archive members which are not needed are never decompressed"""
+        self._checkArchiveHeader(arrays, name)
+        evaluations = arrays["evaluations"]
+        rows = np.arange(len(evaluations)) if minEvaluation is None else np.nonzero(evaluations >= minEvaluation)[0]
+        alleleLength = int(arrays["alleleLength"])
+
+        snapshot = {}
+        if "n" in fields:
+            snapshot["n"] = arrays["interpolationPoints"][rows].astype(np.int64)
+        if "t" in fields:
+            snapshot["t"] = arrays["thresholds"][rows].astype(np.int64)
+        if "a" in fields:
+            snapshot["a"] = np.full(len(rows), alleleLength, dtype=np.int64)
+        if "e" in fields:
+            snapshot["e"] = evaluations[rows]
+
+        if "g" in fields or "agents" in fields:
+            population = MainAgentPopulation.fromPackedGenes(
+                arrays["genes"][rows], arrays["lengths"][rows], arrays["thresholds"][rows],
+                arrays["interpolationPoints"][rows], evaluations[rows], alleleLength
+            )
+            if "g" in fields:
+                snapshot["g"] = [population.getGeneticRepresentation(index) for index in range(population.getSize())]
+            if "agents" in fields:
+                snapshot["agents"] = population.getAgents()
+
+        return snapshot
+
+    def _checkArchiveHeader(self, arrays, name: str) -> None:
+        header = json.loads(str(arrays["header"]))
+        if header.get("format") != self.FORMAT or header.get("version", 0) > self.VERSION:
+            raise ValueError(f"Unsupported state file '{name}': {header}.")
+
+
+class RunLogMainAgentStateAdapter(NpzMainAgentStateAdapter):
+    """
+    Appends snapshots, as numpy archives, to a RunLog in the directory, load(index) reads a single index
+    record instead of listing the directory. Directories without a run log are read file by file.
+
+    With a keyframeInterval above 1 only every keyframeInterval-th snapshot is stored whole, the others are
+    deltas against the snapshot before: for every agent the row of an identical agent in the previous
+    snapshot or the agent itself when it changed, plus all evaluations.
+    """
+    LOG_NAME = "run"
+    DELTA_FORMAT = "genetics.MainAgentPopulationDelta"
+
+    __log: RunLog | None = None
+    __sync: bool
+    __keyframeInterval: int
+    __previous: MainAgentPopulation | None = None
+    __reconstructed: Tuple[int, MainAgentPopulation] | None = None
+
+    def __init__(self, directory: str, prefix: str, legacy: bool = False, compressed: bool = True,
+                 sync: bool = True, keyframeInterval: int = 1):
+        super().__init__(directory, prefix, legacy, compressed)
+        if keyframeInterval < 1:
+            raise ValueError("keyframeInterval must be at least 1.")
+
+        self.__sync = sync
+        self.__keyframeInterval = keyframeInterval
+
+    def load(self, index: int = None) -> List[Agent]:
+        if self.__log is None and not RunLog.exists(self._dir, self.LOG_NAME):
+            return super().load(index)
+
+        log = self.__getLog(False)
+        size = log.getSize()
+        if size == 0 or (index is not None and index >= size):
+            return []
+
+        index = size - 1 if index is None else index
+
+        return self.__reconstruct(index).getAgents()
+
+    def readSnapshots(self, fields: Tuple[str, ...] = ("e",), minEvaluation: float = None,
+                      start: int = 0) -> Iterator[Dict]:
+        if self.__log is None and not RunLog.exists(self._dir, self.LOG_NAME):
+            yield from super().readSnapshots(fields, minEvaluation, start)
+            return
+
+        fields = self._checkSnapshotFields(fields)
+        log = self.__getLog(False)
+        index = start
+
+        # The size is read again after every snapshot, snapshots appended meanwhile are read as well
+        while index < log.getSize():
+            name = f"{self._dir}/{self.LOG_NAME}#{index}"
+            with np.load(io.BytesIO(log.read(index)), allow_pickle=False) as arrays:
+                # Deltas hold every evaluation, other fields need the snapshot rebuilt from its keyframe
+                if self.__isDelta(arrays) and not set(fields) <= {"e", "a"}:
+                    snapshot = self._projectArchive(self.__getArchiveArrays(self.__reconstruct(index)), name,
+                                                    fields, minEvaluation)
+                else:
+                    snapshot = self._projectArchive(arrays, name, fields, minEvaluation)
+            snapshot["index"] = index
+            yield snapshot
+            index += 1
+
+    def save(self, data: List[Agent], generation: int = None) -> None:
+        self.setState(data)
+        population = MainAgentPopulation.fromAgents(self._state)
+        log = self.__getLog(True)
+        buffer = io.BytesIO()
+
+        if self.__previous is None or log.getSize() % self.__keyframeInterval == 0:
+            self._writeArchive(buffer, self._state)
+        else:
+            self.__writeDelta(buffer, self.__previous, population)
+
+        log.append(buffer.getvalue(), generation)
+        self.__previous = population if self.__keyframeInterval > 1 else None
+
+    def loadGeneration(self, generation: int) -> List[Agent]:
+        """The snapshot saved in the given generation of the algorithm, empty when there is none"""
+        index = self.__getLog(False).findGeneration(generation) if RunLog.exists(self._dir, self.LOG_NAME) else None
+
+        return [] if index is None else self.load(index)
+
+    def getSize(self) -> int:
+        """Number of snapshots in the run log"""
+        return self.__getLog(False).getSize() if RunLog.exists(self._dir, self.LOG_NAME) else 0
+
+    def truncate(self, size: int) -> None:
+        """Keep only the first size snapshots"""
+        if RunLog.exists(self._dir, self.LOG_NAME):
+            self.__getLog(True).truncate(size)
+            self.__previous = None
+            self.__reconstructed = None
+
+    def getSavePoint(self) -> {}:
+        return {"snapshots": self.getSize(), "histograms": self._getHistogramCount()}
+
+    def rollback(self, savePoint: {}) -> None:
+        if "snapshots" in savePoint:
+            self.truncate(savePoint["snapshots"])
+
+        if "histograms" in savePoint:
+            self._truncateHistograms(savePoint["histograms"])
+
+    def close(self) -> None:
+        if self.__log is not None:
+            self.__log.close()
+            self.__log = None
+
+    def _checkArchiveHeader(self, arrays, name: str) -> None:
+        if not self.__isDelta(arrays):
+            super()._checkArchiveHeader(arrays, name)
+
+    def __getLog(self, writable: bool) -> RunLog:
+        if self.__log is None or (writable and not self.__log.isWritable()):
+            self.close()
+            self.__log = RunLog(self._dir, self.LOG_NAME, writable, self.__sync)
+
+        return self.__log
+
+    def __writeDelta(self, file, previous: MainAgentPopulation, population: MainAgentPopulation) -> None:
+        previousKeys = self.__getRowKeys(previous)
+        keys = self.__getRowKeys(population)
+
+        rows = {}
+        for row, key in enumerate(previousKeys):
+            rows.setdefault(key, row)
+
+        sources = np.array([rows.get(key, -1) for key in keys], dtype=np.int32)
+        changed = np.nonzero(sources < 0)[0]
+        changedPopulation = MainAgentPopulation.fromArrays(
+            population.getGenes()[changed], population.getLengths()[changed], population.getThresholds()[changed],
+            population.getInterpolationPoints()[changed], population.getEvaluations()[changed],
+            population.getAlleleLength()
+        )
+        header = json.dumps({"format": self.DELTA_FORMAT, "version": self.VERSION})
+
+        self._saveArrays(file, header=np.array(header), sources=sources, genes=changedPopulation.getPackedGenes(),
+                         lengths=changedPopulation.getLengths().astype(np.int32),
+                         thresholds=changedPopulation.getThresholds().astype(np.int32),
+                         interpolationPoints=changedPopulation.getInterpolationPoints().astype(np.int32),
+                         evaluations=population.getEvaluations(), alleleLength=np.array(population.getAlleleLength()))
+
+    def __reconstruct(self, index: int) -> MainAgentPopulation:
+        """Snapshot index rebuilt from its keyframe, the last one is kept so reading in order applies one delta"""
+        log = self.__getLog(False)
+        chain = []
+
+        while self.__reconstructed is None or self.__reconstructed[0] != index:
+            with np.load(io.BytesIO(log.read(index)), allow_pickle=False) as arrays:
+                if not self.__isDelta(arrays):
+                    self.__reconstructed = index, MainAgentPopulation.fromPackedGenes(
+                        arrays["genes"], arrays["lengths"], arrays["thresholds"], arrays["interpolationPoints"],
+                        arrays["evaluations"], int(arrays["alleleLength"]))
+                    break
+
+                chain.append((index, {name: arrays[name] for name in arrays.files}))
+            index -= 1
+
+        for index, arrays in reversed(chain):
+            self.__reconstructed = index, self.__applyDelta(self.__reconstructed[1], arrays)
+
+        return self.__reconstructed[1]
+
+    @staticmethod
+    def __applyDelta(previous: MainAgentPopulation, arrays: Dict[str, np.ndarray]) -> MainAgentPopulation:
+        sources = arrays["sources"].astype(np.int64)
+        changed = np.nonzero(sources < 0)[0]
+        alleleLength = previous.getAlleleLength()
+        changedPopulation = MainAgentPopulation.fromPackedGenes(
+            arrays["genes"], arrays["lengths"], arrays["thresholds"], arrays["interpolationPoints"],
+            arrays["evaluations"][changed], alleleLength)
+
+        copied = np.nonzero(sources >= 0)[0]
+        capacity = max(previous.getGenes().shape[1], changedPopulation.getGenes().shape[1])
+        genes = np.zeros((len(sources), capacity), dtype=np.uint64)
+        genes[copied, :previous.getGenes().shape[1]] = previous.getGenes()[sources[copied]]
+        genes[changed, :changedPopulation.getGenes().shape[1]] = changedPopulation.getGenes()
+
+        lengths, thresholds, interpolationPoints = (np.zeros(len(sources), dtype=np.int64) for _ in range(3))
+        for target, previousValues, changedValues in (
+                (lengths, previous.getLengths(), changedPopulation.getLengths()),
+                (thresholds, previous.getThresholds(), changedPopulation.getThresholds()),
+                (interpolationPoints, previous.getInterpolationPoints(), changedPopulation.getInterpolationPoints())):
+            target[copied] = previousValues[sources[copied]]
+            target[changed] = changedValues
+
+        return MainAgentPopulation.fromArrays(genes, lengths, thresholds, interpolationPoints,
+                                              arrays["evaluations"].astype(np.float64), alleleLength)
+
+    @staticmethod
+    def __getRowKeys(population: MainAgentPopulation) -> List[bytes]:
+        """Genome, with the words past every agent's length cleared, threshold and interpolation points per row"""
+        genes = population.getGenes()
+        lengths = population.getLengths()
+        visible = np.where(np.arange(genes.shape[1])[None, :] < lengths[:, None], genes, np.uint64(0))
+        capacity = int(lengths.max(initial=0))
+        rows = np.column_stack((visible[:, :capacity], lengths.astype(np.uint64),
+                                population.getThresholds().astype(np.uint64),
+                                population.getInterpolationPoints().astype(np.uint64)))
+        rows = np.ascontiguousarray(rows)
+
+        return [row.tobytes() for row in rows]
+
+    @staticmethod
+    def __isDelta(arrays) -> bool:
+        return "sources" in arrays
+
+    def __getArchiveArrays(self, population: MainAgentPopulation) -> Dict[str, np.ndarray]:
+        """The arrays of a keyframe archive holding population"""
+        return {
+            "header": np.array(json.dumps({"format": self.FORMAT, "version": self.VERSION})),
+            "genes": population.getPackedGenes(), "lengths": population.getLengths(),
+            "thresholds": population.getThresholds(), "interpolationPoints": population.getInterpolationPoints(),
+            "evaluations": population.getEvaluations(), "alleleLength": np.array(population.getAlleleLength()),
+        }
+
+
 class BaseCrosser(Crosser, ABC):
     _chance: float
     _crossoverPoints: int
@@ -270,6 +1510,70 @@ class BaseCrosser(Crosser, ABC):
     def __cross(self, inputStr, replaceWith, startingAt):
         return inputStr[:startingAt] + replaceWith
 
+    def crossoverPopulation(self, agents: List[Agent]) -> None:
+        backing = MainAgentPopulation.findBackingPopulation(agents)
+        if backing is None:
+            super().crossoverPopulation(agents)
+            return
+
+        population, indices = backing
+        alleleLength = population.getAlleleLength()
+        lengths = (population.getLengths()[indices] * alleleLength).tolist()
+        divider = 2
+        pairs, cuts, levels = [], [], []
+        lastLevels = [0] * len(agents)
+
+        # Draws follow the pair by pair stage exactly, so a seeded run gives the same population
+        for x in range(math.floor(len(agents) / divider)):
+            first, second = random.sample(range(len(agents)), divider)
+            if not self.checkIfRun([agents[first], agents[second]]):
+                continue
+
+            maxCuttingPoint = min(lengths[first], lengths[second])
+            cuts.append(sorted(random.randint(0, maxCuttingPoint) for _ in range(self._crossoverPoints)))
+            pairs.append((first, second))
+
+            if self._crossoverPoints % 2 == 1:
+                lengths[first], lengths[second] = lengths[second], lengths[first]
+
+            # Pairs on the same level share no agent and only depend on pairs of earlier levels
+            level = max(lastLevels[first], lastLevels[second]) + 1
+            lastLevels[first] = lastLevels[second] = level
+            levels.append(level)
+
+        if not pairs:
+            return
+
+        pairs, cuts, levels = np.array(pairs), np.array(cuts).reshape(len(pairs), -1), np.array(levels)
+        genes = population.getGenes()
+        rowLengths = population.getLengths()
+        allOnes = np.uint64(2 ** 64 - 1)
+
+        # Bit p is swapped when an odd number of cuts lies at or before p
+        alleleEnds = (np.arange(genes.shape[1]) + 1) * alleleLength
+        suffixBits = np.clip(alleleEnds[None, None, :] - cuts[:, :, None], 0, alleleLength)
+        suffixMasks = np.where(suffixBits >= 64, allOnes,
+                               np.left_shift(np.uint64(1), np.minimum(suffixBits, 63).astype(np.uint64)) - np.uint64(1))
+        swapMasks = np.bitwise_xor.reduce(suffixMasks, axis=1)
+
+        for level in range(1, levels.max() + 1):
+            selected = np.nonzero(levels == level)[0]
+            first, second = indices[pairs[selected, 0]], indices[pairs[selected, 1]]
+            masks = swapMasks[selected]
+            firstGenes, secondGenes = genes[first], genes[second]
+
+            genes[first] = (firstGenes & ~masks) | (secondGenes & masks)
+            genes[second] = (secondGenes & ~masks) | (firstGenes & masks)
+
+            rows, alleles = np.nonzero((firstGenes ^ secondGenes) & masks)
+            population.markChanged(np.concatenate((first[rows], second[rows])), np.concatenate((alleles, alleles)))
+
+            if self._crossoverPoints % 2 == 1:
+                # Swapped lengths change the curves even when the swapped tails are equal words
+                resized = rowLengths[first] != rowLengths[second]
+                population.markChanged(np.concatenate((first[resized], second[resized])))
+                rowLengths[first], rowLengths[second] = rowLengths[second], rowLengths[first].copy()
+
 
 class BaseMutator(Mutator, ABC):
     _chance: float
@@ -295,6 +1599,67 @@ class BaseMutator(Mutator, ABC):
 
         agent.setGeneticRepresentation(newGeneticRepresentation)
 
+    def getBitChances(self, evaluations: np.ndarray) -> np.ndarray | None:
+        """Per-agent probability of flipping a significant bit, None when only per-bit checks are available"""
+        return None
+
+    def mutatePopulation(self, agents: List[Agent]) -> None:
+        backing = MainAgentPopulation.findBackingPopulation(agents)
+        chances = None if backing is None else self.getBitChances(backing[0].getEvaluations()[backing[1]])
+
+        if chances is None:
+            super().mutatePopulation(agents)
+            return
+
+        population, indices = backing
+        alleleLength = population.getAlleleLength()
+        period = alleleLength - 1
+        perPeriod = min(self._significantAlleles + 1, period)
+
+        # Bit i of a genome can mutate when i % (alleleLength - 1) <= significantAlleles
+        bits = population.getLengths()[indices] * alleleLength
+        candidates = (bits // period) * perPeriod + np.minimum(bits % period, perPeriod)
+        chances = np.clip(chances, 0, 1)
+        maxChance = chances.max(initial=0)
+        total = int(candidates.sum())
+
+        if maxChance <= 0 or total == 0:
+            return
+
+        # Skip sampling at the highest chance over all candidate bits, thinned to every agent's own chance
+        positions = self.__sampleBernoulliPositions(total, maxChance)
+        offsets = np.cumsum(candidates)
+        rows = np.searchsorted(offsets, positions, side='right')
+        accepted = np.random.random(len(positions)) * maxChance < chances[rows]
+        positions, rows = positions[accepted], rows[accepted]
+
+        if len(positions) == 0:
+            return
+
+        candidateIndices = positions - (offsets[rows] - candidates[rows])
+        bitIndices = (candidateIndices // perPeriod) * period + candidateIndices % perPeriod
+        masks = np.left_shift(np.uint64(1), (alleleLength - 1 - bitIndices % alleleLength).astype(np.uint64))
+
+        genes = population.getGenes()
+        flatIndices = indices[rows] * genes.shape[1] + bitIndices // alleleLength
+        np.bitwise_xor.at(genes.reshape(-1), flatIndices, masks)
+        population.markChanged(indices[rows], bitIndices // alleleLength)
+
+    @staticmethod
+    def __sampleBernoulliPositions(total: int, chance: float) -> np.ndarray:
+        """Positions in [0, total) which succeed in independent Bernoulli(chance) trials"""
+        if chance >= 1:
+            return np.arange(total)
+
+        expected = total * chance
+        positions = np.cumsum(np.random.geometric(chance, int(expected + 5 * math.sqrt(expected) + 10))) - 1
+
+        while positions[-1] < total:
+            more = np.random.geometric(chance, len(positions))
+            positions = np.concatenate((positions, positions[-1] + np.cumsum(more)))
+
+        return positions[positions < total]
+
 
 class RandomMainAgentFactory(AgentFactory):
     _xMax: int
@@ -382,8 +1747,44 @@ class ClosePositionMainAgentFactory(RandomMainAgentFactory):
         return self._createBinaryString(int(x)) + self._createBinaryString(int(y))
 
 
+def getWindowAverages(summedAreaTable: np.ndarray, xs: np.ndarray, ys: np.ndarray,
+                      thresholds: np.ndarray) -> np.ndarray:
+    """
+    Average of the (threshold // 2) neighbourhood of every point, clipped like the original slicing:
+    windows span [max(0, c - r), min(cMax, c + r + 1)) with cMax being the last index of the reference.
+    """
+    xMax, yMax = summedAreaTable.shape[1] - 2, summedAreaTable.shape[0] - 2
+    radius = np.floor_divide(thresholds, 2)
+    xMin = np.clip(xs - radius, 0, xMax)
+    yMin = np.clip(ys - radius, 0, yMax)
+    xEnd = np.clip(xs + radius + 1, xMin, xMax)
+    yEnd = np.clip(ys + radius + 1, yMin, yMax)
+
+    area = (xEnd - xMin) * (yEnd - yMin)
+    total = (summedAreaTable[yEnd, xEnd] - summedAreaTable[yMin, xEnd]
+             - summedAreaTable[yEnd, xMin] + summedAreaTable[yMin, xMin])
+
+    return np.divide(total, area, out=np.zeros(np.shape(total)), where=area > 0)
+
+
+def getValuesOnPoints(values: np.ndarray, summedAreaTable: np.ndarray, xs: np.ndarray, ys: np.ndarray,
+                      thresholds: np.ndarray, scale: int = 1) -> np.ndarray:
+    """Values are divided by scale, the summed-area table is expected to hold the divided values already"""
+    xs, ys, thresholds = np.broadcast_arrays(xs, ys, thresholds)
+    result = np.asarray(values[ys, xs], dtype=float)
+    if scale != 1:
+        result /= scale
+
+    windowed = thresholds > 1
+    if windowed.any():
+        result[windowed] = getWindowAverages(summedAreaTable, xs[windowed], ys[windowed], thresholds[windowed])
+
+    return result
+
+
 class JsonReference(Reference):
     __pointsValues: np.ndarray
+    __summedAreaTable: np.ndarray
     __filePath: str
 
     def __init__(self, filePath):
@@ -397,9 +1798,19 @@ class JsonReference(Reference):
 
         return float(self.__pointsValues[y, x])
 
+    def getValuesOnPoints(self, xs: np.ndarray, ys: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        return getValuesOnPoints(self.__pointsValues, self.__summedAreaTable, xs, ys, thresholds)
+
+    def getValues(self) -> np.ndarray:
+        return self.__pointsValues
+
+    def getSummedAreaTable(self) -> np.ndarray:
+        return self.__summedAreaTable
+
     def setValueOnPoint(self, value: float, point: Point) -> None:
         x, y = point.getX(), point.getY()
         if 0 <= x <= self.__xMax and 0 <= y <= self.__yMax:
+            self.__summedAreaTable[y + 1:, x + 1:] += value - self.__pointsValues[y, x]
             self.__pointsValues[y, x] = value
 
     def xMax(self) -> int:
@@ -413,9 +1824,13 @@ class JsonReference(Reference):
         yMin, yMax = max(0, y - threshold), min(self.yMax(), y + threshold + 1)
         xMin, xMax = max(0, x - threshold), min(self.xMax(), x + threshold + 1)
 
-        neighbors = self.__pointsValues[yMin:yMax, xMin:xMax].flatten()
+        if yMin >= yMax or xMin >= xMax:
+            return 0.0
 
-        return np.mean(neighbors) if neighbors.size > 0 else 0.0
+        table = self.__summedAreaTable
+        total = table[yMax, xMax] - table[yMin, xMax] - table[yMax, xMin] + table[yMin, xMin]
+
+        return float(total / ((yMax - yMin) * (xMax - xMin)))
 
     def __getDataFromFile(self) -> None:
         try:
@@ -429,6 +1844,7 @@ class JsonReference(Reference):
 
                 if isinstance(pointsValues, list):
                     self.__pointsValues = np.array(pointsValues, dtype=float)
+                    self.__summedAreaTable = createSummedAreaTable(self.__pointsValues)
                     self.__yMax, self.__xMax = self.__pointsValues.shape[0] - 1, self.__pointsValues.shape[1] - 1
                 else:
                     print("Error: 'pointsValues' in JSON file is not an array.")
@@ -439,3 +1855,136 @@ class JsonReference(Reference):
             print(f"Error: File not found at {self.__filePath}.")
         except json.JSONDecodeError:
             print("Error: Invalid JSON format.")
+
+
+class NpyReference(Reference):
+    """
+    Reference stored as an .npy matrix of integers, the values multiplied by scale, with a JSON header and
+    a precomputed summed-area table next to it. Both arrays are memory-mapped, so opening does not depend
+    on the image size and processes opening the same files share their pages. Pickling carries the path.
+    """
+    FORMAT = "genetics.Reference"
+    VERSION = 1
+
+    __filePath: str
+    __storedValues: np.ndarray
+    __summedAreaTable: np.ndarray
+    __scale: int
+    __values: np.ndarray | None = None
+
+    def __init__(self, filePath: str):
+        self.__filePath = str(filePath)
+        self.__open()
+
+    @classmethod
+    def create(cls, filePath: str, storedValues: np.ndarray, scale: int = 255) -> "NpyReference":
+        """Write storedValues, representing storedValues / scale, with their header and summed-area table"""
+        filePath = str(filePath)
+        storedValues = np.ascontiguousarray(storedValues)
+        if storedValues.ndim != 2 or storedValues.dtype.kind not in "ui":
+            raise ValueError(f"Reference values must be a matrix of integers, got {storedValues.dtype} "
+                             f"{storedValues.shape}.")
+
+        summedAreaTablePath = cls.__getSummedAreaTablePath(filePath)
+        np.save(filePath, storedValues)
+        np.save(summedAreaTablePath, createSummedAreaTable(storedValues / scale))
+
+        with open(cls.__getHeaderPath(filePath), 'w') as headerFile:
+            json.dump({
+                "format": cls.FORMAT,
+                "version": cls.VERSION,
+                "xMax": storedValues.shape[1] - 1,
+                "yMax": storedValues.shape[0] - 1,
+                "dtype": storedValues.dtype.str,
+                "scale": scale,
+                "summedAreaTable": os.path.basename(summedAreaTablePath),
+            }, headerFile)
+
+        return NpyReference(filePath)
+
+    @classmethod
+    def fromReference(cls, reference: Reference, filePath: str, scale: int = 255) -> "NpyReference":
+        values = reference.getValues()
+        storedValues = np.rint(values * scale)
+        if not np.array_equal(storedValues / scale, values) or storedValues.min(initial=0) < 0 \
+                or storedValues.max(initial=0) > np.iinfo(np.uint8).max:
+            raise ValueError(f"Reference values are not multiples of 1/{scale} within uint8.")
+
+        return cls.create(filePath, storedValues.astype(np.uint8), scale)
+
+    def getValueOnPoint(self, point: Point, threshold: int = 0) -> int | float:
+        return float(self.getValuesOnPoints(np.array(point.getX()), np.array(point.getY()), np.array(threshold)))
+
+    def getValuesOnPoints(self, xs: np.ndarray, ys: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        return getValuesOnPoints(self.__storedValues, self.__summedAreaTable, xs, ys, thresholds, self.__scale)
+
+    def setValueOnPoint(self, value: float, point: Point) -> None:
+        raise NotImplementedError("NpyReference is read-only.")
+
+    def getValues(self) -> np.ndarray:
+        # Decoded once per process for the callers which need the whole matrix as floats, the native kernel
+        # reads the stored values instead
+        if self.__values is None:
+            self.__values = self.__storedValues / self.__scale
+
+        return self.__values
+
+    def getStoredValues(self) -> np.ndarray:
+        return self.__storedValues
+
+    def getScale(self) -> int:
+        return self.__scale
+
+    def getSummedAreaTable(self) -> np.ndarray:
+        return self.__summedAreaTable
+
+    def getFilePath(self) -> str:
+        return self.__filePath
+
+    def xMax(self) -> int:
+        return self.__storedValues.shape[1] - 1
+
+    def yMax(self) -> int:
+        return self.__storedValues.shape[0] - 1
+
+    def __getstate__(self):
+        return self.__filePath
+
+    def __setstate__(self, state):
+        self.__filePath = state
+        self.__values = None
+        self.__open()
+
+    def __open(self) -> None:
+        with open(self.__getHeaderPath(self.__filePath), 'r') as headerFile:
+            header = json.load(headerFile)
+
+        if header.get("format") != self.FORMAT or header.get("version", 0) > self.VERSION:
+            raise ValueError(f"Unsupported reference '{self.__filePath}': {header}.")
+
+        self.__storedValues = np.load(self.__filePath, mmap_mode='r')
+        self.__summedAreaTable = np.load(
+            os.path.join(os.path.dirname(self.__filePath), header["summedAreaTable"]), mmap_mode='r')
+        self.__scale = header["scale"]
+
+        if self.__storedValues.shape != (header["yMax"] + 1, header["xMax"] + 1) \
+                or self.__summedAreaTable.shape != (header["yMax"] + 2, header["xMax"] + 2):
+            raise ValueError(f"Reference '{self.__filePath}' does not match its header.")
+
+    @staticmethod
+    def __getHeaderPath(filePath: str) -> str:
+        return f"{filePath}.json"
+
+    @staticmethod
+    def __getSummedAreaTablePath(filePath: str) -> str:
+        return f"{os.path.splitext(filePath)[0]}.sat.npy"
+
+
+def openReference(directoryPath: str) -> Reference | None:
+    """The binary reference of a directory if it was generated, reference.json otherwise"""
+    for fileName, referenceClass in (("reference.npy", NpyReference), ("reference.json", JsonReference)):
+        path = os.path.join(directoryPath, fileName)
+        if os.path.isfile(path):
+            return referenceClass(path)
+
+    return None
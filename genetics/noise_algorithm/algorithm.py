@@ -1,3 +1,4 @@
+import pickle
 import time
 from multiprocessing import Pool
 from typing import List
@@ -8,10 +9,21 @@ import numpy as np
 
 from genetics.basics import GeneticAlgorithm, AlgorithmStateAdapter, Agent, FitnessFunction, Reference, Crosser, \
     Mutator, AgentFactory
+from genetics.classes import interpolateAgents, MainAgent, MainAgentPopulation, curveCache, FitnessCache, \
+    sampleAgentsAdaptive, getSamplingLimit, classifyAgentBounds, boundsFilterCounters, hasNativeEvaluation, \
+    BOUNDS_OUTSIDE, BOUNDS_INSIDE
+from genetics.shared_memory import SharedMemoryExecutor
+from genetics.background_writer import BackgroundStateAdapter
+from genetics.checkpoint import Checkpoint
+
+
+SAMPLING_MODES = ("uniform", "adaptive")
+SNAPSHOT_POLICIES = ("full", "top", "quantile")
 
 
 class NoiseAlgorithm(GeneticAlgorithm):
     __population: List[Agent]
+    __store: MainAgentPopulation | None = None
 
     __fitnessFunctions: List[FitnessFunction] = []
     __fitnessFunctionsWages: List[float] = []
@@ -23,7 +35,22 @@ class NoiseAlgorithm(GeneticAlgorithm):
     __mutator: Mutator
     __agentFactory: AgentFactory
 
-    __executor: Pool
+    __executor: "Pool | SharedMemoryExecutor"
+    __pickledBytes: int = 0
+    __curveCacheHits: int = 0
+    __curveCacheMisses: int = 0
+    __boundsCounts: np.ndarray
+
+
+    __fitnessCache: FitnessCache
+    __rawScores: np.ndarray | None = None
+    __evaluatedVersions: np.ndarray | None = None
+    __evaluatedSettings: np.ndarray | None = None
+    __fitnessCacheCounters: {} = {}
+
+    __generation: int = 0
+    __snapshots: int = 0
+    __checkpointPath: str | None = None
 
     def __init__(
             self,
@@ -33,7 +60,8 @@ class NoiseAlgorithm(GeneticAlgorithm):
             mutator: Mutator,
             agentFactory: AgentFactory,
             config: {},
-            executor: Pool
+            executor: "Pool | SharedMemoryExecutor",
+            checkpointPath: str = None
     ):
         self.__reference = reference
         self.__stateAdapter = stateAdapter
@@ -42,6 +70,20 @@ class NoiseAlgorithm(GeneticAlgorithm):
         self.__agentFactory = agentFactory
         self.__config = config
         self.__executor = executor
+        self.__checkpointPath = checkpointPath
+        # Per instance, the class attributes would be shared by every algorithm of the process
+        self.__fitnessFunctions = []
+        self.__fitnessFunctionsWages = []
+
+        curveCache.setMaxSize(self.__config.get("curveCacheSize", 8192))
+        self.__fitnessCache = FitnessCache(self.__config.get("fitnessCacheSize", 65536))
+        self.__fitnessCacheCounters = {}
+        self.__boundsCounts = np.zeros(3, dtype=np.int64)
+
+        if self.__config.get("samplingMode", "uniform") not in SAMPLING_MODES:
+            raise ValueError(f"samplingMode must be one of {', '.join(SAMPLING_MODES)}.")
+        if self.__config.get("snapshotPolicy", "full") not in SNAPSHOT_POLICIES:
+            raise ValueError(f"snapshotPolicy must be one of {', '.join(SNAPSHOT_POLICIES)}.")
 
         self.__initialize()
 
@@ -51,18 +93,120 @@ class NoiseAlgorithm(GeneticAlgorithm):
     def addFitnessFunction(self, fitnessFunc: FitnessFunction, wage: float) -> None:
         self.__fitnessFunctions.append(fitnessFunc)
         self.__fitnessFunctionsWages.append(wage)
+        self.__invalidateEvaluations()
 
     def save(self) -> None:
-        self.__stateAdapter.save([agent.clone() for agent in self.__population])
+        self.__snapshots += 1
+        evaluations = np.array([agent.getEvaluationValue() for agent in self.__population])
+        population = [self.__population[position] for position in self.__getSnapshotPositions(evaluations)]
+
+        if len(evaluations) > 0:
+            minimum, maximum = float(evaluations.min()), float(evaluations.max())
+            counts, _ = np.histogram(evaluations, self.__config.get("snapshotHistogramBins", 64), (minimum, maximum))
+            self.__stateAdapter.saveHistogram(counts, minimum, maximum)
+
+        if self.__store is None:
+            self.__stateAdapter.save([agent.clone() for agent in population], self.__generation)
+            return
+
+        # One copy of the packed rows instead of a clone per agent, frozen as writers may hold on to it
+        snapshot = MainAgentPopulation.fromAgents(population)
+        snapshot.freeze()
+        self.__stateAdapter.save(snapshot.getAgents(), self.__generation)
+
+    def __getSnapshotPositions(self, evaluations: np.ndarray) -> np.ndarray:
+        """Positions of the agents the snapshot keeps, in population order"""
+        policy = self.__config.get("snapshotPolicy", "full")
+        first, last = self.__snapshots == 1, self.__generation >= self.__config["iterations"]
+
+        if policy == "full" or first or last or len(evaluations) == 0:
+            return np.arange(len(evaluations))
+
+        # Snapshots hold the raw scores, which output_image_generator filters with minEvaluation, so both
+        # policies keep the highest raw scores. Normalization reverses the order (the highest raw score
+        # becomes 0), these are not the agents above a quantile of the normalized scores.
+        if policy == "top":
+            best = np.argsort(-evaluations, kind='stable')[:self.__config.get("snapshotTopK", 100)]
+            return np.sort(best)
+
+        return np.nonzero(evaluations >= np.quantile(evaluations, self.__config.get("snapshotQuantile", 0.9)))[0]
 
     def load(self, algorithmState: AlgorithmStateAdapter) -> None:
         if self.__stateAdapter.hasState():
-            self.__population = self.__stateAdapter.load()
+            self.__setPopulation(self.__stateAdapter.load())
+
+    def saveCheckpoint(self, path: str) -> None:
+        """Save everything the remaining generations depend on, a resumed run gives the same results"""
+        if self.__store is None:
+            raise ValueError("Checkpoints need a population of MainAgents.")
+
+        # The checkpoint must not count snapshots which are still queued, the save point waits for them
+        savePoint = self.__stateAdapter.getSavePoint()
+
+        store = self.__store
+        rows = np.array([agent.getIndex() for agent in self.__population], dtype=np.int64)
+        settings = np.stack((store.getVersions()[rows], store.getThresholds()[rows],
+                             store.getInterpolationPoints()[rows]), axis=1)
+        pythonVersion, pythonState, pythonGauss = random.getstate()
+        _, numpyKeys, numpyPosition, numpyHasGauss, numpyGauss = np.random.get_state()
+
+        Checkpoint({
+            "generation": self.__generation,
+            "snapshots": self.__snapshots,
+            "savePoint": savePoint,
+            "config": self.__config,
+            "alleleLength": store.getAlleleLength(),
+            "pythonRandom": {"version": pythonVersion, "gauss": pythonGauss},
+            "numpyRandom": {"position": int(numpyPosition), "hasGauss": int(numpyHasGauss),
+                            "gauss": float(numpyGauss)},
+        }, {
+            "genes": store.getGenes()[rows],
+            "lengths": store.getLengths()[rows],
+            "thresholds": store.getThresholds()[rows],
+            "interpolationPoints": store.getInterpolationPoints()[rows],
+            "evaluations": store.getEvaluations()[rows],
+            "rawScores": self.__rawScores[rows],
+            "evaluated": np.all(self.__evaluatedSettings[rows] == settings, axis=1),
+            "pythonRandomState": np.array(pythonState, dtype=np.int64),
+            "numpyRandomState": numpyKeys,
+        }).save(path)
+
+    def resume(self, checkpoint: Checkpoint) -> None:
+        """Continue from a checkpoint, fitness functions have to be added before"""
+        header = checkpoint.getHeader()
+        store = MainAgentPopulation.fromArrays(
+            checkpoint.getArray("genes"), checkpoint.getArray("lengths"), checkpoint.getArray("thresholds"),
+            checkpoint.getArray("interpolationPoints"), checkpoint.getArray("evaluations"), header["alleleLength"]
+        )
+        self.__setPopulation(store.getAgents())
+
+        # Rows evaluated since their last change keep their raw score, like in the interrupted run
+        evaluated = checkpoint.getArray("evaluated")
+        self.__rawScores[:] = checkpoint.getArray("rawScores")
+        self.__evaluatedSettings[evaluated] = np.stack((self.__store.getVersions(), self.__store.getThresholds(),
+                                                        self.__store.getInterpolationPoints()), axis=1)[evaluated]
+
+        self.__generation = checkpoint.getGeneration()
+        self.__snapshots = checkpoint.getSnapshots()
+
+        # Snapshots and histograms saved after the checkpoint are saved again by the resumed run,
+        # checkpoints without a save point only know the number of snapshots
+        self.__stateAdapter.rollback(header.get("savePoint", {"snapshots": checkpoint.getSnapshots()}))
+
+        pythonRandom, numpyRandom = header["pythonRandom"], header["numpyRandom"]
+        random.setstate((pythonRandom["version"], tuple(checkpoint.getArray("pythonRandomState").tolist()),
+                         pythonRandom["gauss"]))
+        np.random.set_state(("MT19937", checkpoint.getArray("numpyRandomState"), numpyRandom["position"],
+                             numpyRandom["hasGauss"], numpyRandom["gauss"]))
+
+    def getGeneration(self) -> int:
+        return self.__generation
 
     def run(self) -> None:
         iterations = self.__config["iterations"]
+        checkpointFreq = self.__config.get("checkpointFreq", 0)
 
-        for x in range(iterations):
+        for x in range(self.__generation, iterations):
             self.__evaluateAgents()
 
             # when without first population
@@ -77,12 +221,43 @@ class NoiseAlgorithm(GeneticAlgorithm):
 
             self.__crossoverAgents()
             self.__mutateAgents()
+            self.__generation = x + 1
+
+            if checkpointFreq and self.__checkpointPath is not None and self.__generation % checkpointFreq == 0:
+                self.saveCheckpoint(self.__checkpointPath)
 
             progress = round(x / iterations * 100, 2)
             print(f"{progress}%")
 
+            if self.__config.get("reportPickledBytes", False):
+                print(f"pickled: {self.__pickledBytes} B")
+            if self.__config.get("reportCurveCache", False):
+                self.__reportCurveCache()
+            if self.__config.get("reportFitnessCache", False):
+                self.__reportFitnessCache()
+            if self.__config.get("reportSaving", False) and isinstance(self.__stateAdapter, BackgroundStateAdapter):
+                adapter = self.__stateAdapter
+                print(f"saving: {adapter.getQueueDepth()} queued, {adapter.getLag():.3f} s lag, "
+                      f"last write {adapter.getLastWriteTime():.3f} s")
+            if self.__config.get("reportBoundsFilter", False):
+                outside, ambiguous, inside = self.__boundsCounts
+                print(f"bounds filter: {outside} rejected, {ambiguous} checked, {inside} inside")
+            self.__pickledBytes = 0
+            self.__curveCacheHits = 0
+            self.__curveCacheMisses = 0
+            self.__fitnessCacheCounters = {}
+            self.__boundsCounts[:] = 0
+
         self.__evaluateAgents()
 
+    def __reportCurveCache(self) -> None:
+        # The native kernel samples the curves itself, the cache only serves the numpy and adaptive paths
+        if self.__curveCacheHits + self.__curveCacheMisses == 0 and hasNativeEvaluation():
+            print("curve cache: not used, curves are sampled by the native kernel")
+            return
+
+        print(f"curve cache: {self.__curveCacheHits} hits, {self.__curveCacheMisses} misses")
+
     def __sortAgents(self, ) -> None:
         self.__population = sorted(self.__population, key=lambda x: x.getEvaluationValue(), reverse=False)
 
@@ -100,19 +275,97 @@ class NoiseAlgorithm(GeneticAlgorithm):
 
     def __evaluateAgents(self):
         agents = self.__population
+        evals = np.zeros(len(agents))
+        pending = {}
+        counters = {"unchanged": 0, "hits": 0, "duplicates": 0, "evaluated": 0}
+
+        # Rows which were not touched since their last evaluation keep their raw score
+        rows = settings = unchanged = None
+        if self.__store is not None:
+            rows = np.array([agent.getIndex() for agent in agents], dtype=np.int64)
+            settings = np.stack((self.__store.getVersions()[rows], self.__store.getThresholds()[rows],
+                                 self.__store.getInterpolationPoints()[rows]), axis=1)
+            unchanged = np.all(self.__evaluatedSettings[rows] == settings, axis=1)
+
+        referenceId = id(self.__reference)
+        for position, agent in enumerate(agents):
+            if unchanged is not None and unchanged[position]:
+                evals[position] = self.__rawScores[rows[position]]
+                counters["unchanged"] += 1
+                continue
+
+            key = FitnessCache.createKey(agent, referenceId)
+            value = self.__fitnessCache.get(key)
+            if value is not None:
+                evals[position] = value
+                counters["hits"] += 1
+            elif key in pending:
+                pending[key].append(position)
+                counters["duplicates"] += 1
+            else:
+                pending[key] = [position]
+
+        # Identical genomes are evaluated once
+        values = self.__computeEvaluations([agents[positions[0]] for positions in pending.values()])
+        for (key, positions), value in zip(pending.items(), values):
+            self.__fitnessCache.put(key, float(value))
+            evals[positions] = value
+        counters["evaluated"] = len(pending)
+
+        if rows is not None:
+            self.__rawScores[rows] = evals
+            self.__evaluatedSettings[rows] = settings
+
+        for key, count in counters.items():
+            self.__fitnessCacheCounters[key] = self.__fitnessCacheCounters.get(key, 0) + count
+
+        for agent, eval_value in zip(agents, evals):
+            agent.setEvaluationValue(eval_value)
+
+    def __computeEvaluations(self, agents: List[Agent]) -> np.ndarray:
         fitnessFunctions = self.__fitnessFunctions
         fitnessFunctionsWages = self.__fitnessFunctionsWages
         reference = self.__reference
 
-        evals = self.__executor.starmap(
-            evaluateAgent,
-            [(agent, fitnessFunctions, fitnessFunctionsWages, reference) for agent in agents]
-        )
-
-        for agent, eval_value in zip(agents, evals):
-            agent.setEvaluationValue(eval_value)
+        chunkSize = self.__config.get("evaluationChunkSize", 256)
+        samplingMode = self.__config.get("samplingMode", "uniform")
+
+        if len(agents) == 0:
+            return np.zeros(0)
+
+        if self.__executor is None:
+            hits, misses = curveCache.getHits(), curveCache.getMisses()
+            boundsFilterCounters.resetCounters()
+            evals = evaluateAgentsBatch(agents, fitnessFunctions, fitnessFunctionsWages, reference, samplingMode)
+            self.__curveCacheHits += curveCache.getHits() - hits
+            self.__curveCacheMisses += curveCache.getMisses() - misses
+            self.__boundsCounts += (boundsFilterCounters.getOutside(), boundsFilterCounters.getAmbiguous(),
+                                    boundsFilterCounters.getInside())
+        elif isinstance(self.__executor, SharedMemoryExecutor):
+            evals = self.__executor.evaluate(agents, evaluateAgentsBatch, fitnessFunctions, fitnessFunctionsWages,
+                                             reference, chunkSize, samplingMode)
+            self.__pickledBytes += self.__executor.getPickledBytes()
+            hits, misses = self.__executor.getCurveCacheCounters()
+            self.__curveCacheHits += hits
+            self.__curveCacheMisses += misses
+            self.__boundsCounts += self.__executor.getBoundsFilterCounters()
+        else:
+            tasks = [(agents[start:start + chunkSize], fitnessFunctions, fitnessFunctionsWages, reference,
+                      samplingMode) for start in range(0, len(agents), chunkSize)]
+            results = self.__executor.starmap(evaluateAgentsBatch, tasks)
+            evals = np.concatenate(results)
+
+            if self.__config.get("reportPickledBytes", False):
+                self.__pickledBytes += sum(len(pickle.dumps(task)) for task in tasks) + sum(
+                    len(pickle.dumps(result)) for result in results)
+
+        return evals
 
     def __crossoverAgents(self) -> None:
+        if self.__config.get("crossoverMode", "agent") == "population":
+            self.__crosser.crossoverPopulation(self.__population)
+            return
+
         divider = 2
         for x in range(math.floor(len(self.__population) / divider)):
             agents = random.sample(self.__population, divider)
@@ -120,6 +373,10 @@ class NoiseAlgorithm(GeneticAlgorithm):
                 self.__crosser.crossover(agents)
 
     def __mutateAgents(self) -> None:
+        if self.__config.get("mutationMode", "agent") == "population":
+            self.__mutator.mutatePopulation(self.__population)
+            return
+
         for agent in self.__population:
             self.__mutator.mutate(agent)
 
@@ -128,7 +385,36 @@ class NoiseAlgorithm(GeneticAlgorithm):
         for x in range(int(self.__config["populationSize"])):
             population.append(self.__agentFactory.create())
 
+        self.__setPopulation(population)
+
+    def __setPopulation(self, population: List[Agent]) -> None:
+        self.__store = None
+
+        # MainAgents are moved into one packed population, the list holds views over its rows
+        if population and all(isinstance(agent, MainAgent) for agent in population):
+            self.__store = MainAgentPopulation.fromAgents(population)
+            population = self.__store.getAgents()
+
         self.__population = population
+        self.__invalidateEvaluations()
+
+    def __invalidateEvaluations(self) -> None:
+        self.__fitnessCache.clear()
+        self.__rawScores = None
+        self.__evaluatedSettings = None
+
+        if self.__store is not None:
+            self.__rawScores = np.zeros(self.__store.getSize())
+            self.__evaluatedSettings = np.full((self.__store.getSize(), 3), -1, dtype=np.int64)
+
+    def __reportFitnessCache(self) -> None:
+        counters = self.__fitnessCacheCounters
+        total = sum(counters.values())
+        reused = total - counters.get("evaluated", 0)
+        rate = round(reused / total * 100, 2) if total else 0
+        print(f"fitness cache: {rate}% reused, {counters.get('unchanged', 0)} unchanged, "
+              f"{counters.get('hits', 0)} hits, {counters.get('duplicates', 0)} duplicates, "
+              f"{counters.get('evaluated', 0)} evaluated")
 
 
 def evaluateAgent(agent: Agent, fitnessFunctions, fitnessFunctionsWages, reference) -> float:
@@ -137,3 +423,55 @@ def evaluateAgent(agent: Agent, fitnessFunctions, fitnessFunctionsWages, referen
         eval += fitnessFunctionsWages[index] * fitnessFunc.evaluate(agent, reference)
     agent.setEvaluationValue(eval)
     return eval
+
+
+def evaluateAgentsBatch(agents: List[Agent], fitnessFunctions, fitnessFunctionsWages, reference,
+                        samplingMode: str = "uniform") -> np.ndarray:
+    evals = np.zeros(len(agents))
+    if len(agents) == 0:
+        return evals
+
+    numberOfInterpolationPoints = None if samplingMode == "adaptive" else agents[0].getNumberOfInterpolationPoints()
+    bounds = classifyAgentBounds(agents, reference.xMax(), reference.yMax(), numberOfInterpolationPoints)
+    boundsFilterCounters.add(bounds)
+
+    # Functions scoring curves which leave the reference 0 skip those provably outside without sampling them
+    for zeroOutside in (True, False):
+        indices = [index for index, fitnessFunc in enumerate(fitnessFunctions)
+                   if fitnessFunc.isZeroOutside() is zeroOutside]
+        positions = np.nonzero(bounds != BOUNDS_OUTSIDE)[0] if zeroOutside else np.arange(len(agents))
+        if not indices or len(positions) == 0:
+            continue
+
+        evals[positions] += evaluateSampledAgents(
+            [agents[position] for position in positions], bounds[positions] == BOUNDS_INSIDE,
+            [fitnessFunctions[index] for index in indices], [fitnessFunctionsWages[index] for index in indices],
+            reference, samplingMode
+        )
+
+    return evals
+
+
+def evaluateSampledAgents(agents: List[Agent], inside: np.ndarray, fitnessFunctions, fitnessFunctionsWages, reference,
+                          samplingMode: str = "uniform") -> np.ndarray:
+    """Weighted sum of the fitness functions, the curves are sampled once for all of them"""
+    evals = np.zeros(len(agents))
+
+    if samplingMode == "adaptive":
+        pixels, offsets = sampleAgentsAdaptive(agents, getSamplingLimit(reference))
+        for index, fitnessFunc in enumerate(fitnessFunctions):
+            evals += fitnessFunctionsWages[index] * fitnessFunc.evaluatePixels(agents, pixels, offsets, reference,
+                                                                               inside)
+
+        return evals
+
+    points = None
+    for index, fitnessFunc in enumerate(fitnessFunctions):
+        evaluations = fitnessFunc.evaluateNative(agents, reference, inside)
+        if evaluations is None:
+            points = interpolateAgents(agents) if points is None else points
+            evaluations = fitnessFunc.evaluateBatch(agents, points, reference, inside)
+
+        evals += fitnessFunctionsWages[index] * evaluations
+
+    return evals
\ No newline at end of file
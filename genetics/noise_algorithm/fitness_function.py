@@ -1,6 +1,9 @@
+from typing import List
+
 import numpy as np
 
 from genetics.basics import FitnessFunction, Agent, Reference
+from genetics.classes import hasNativeEvaluation, evaluateCurvesNative
 
 
 class NoiseFitnessFunction(FitnessFunction):
@@ -21,3 +24,62 @@ class NoiseFitnessFunction(FitnessFunction):
             sumOfCoverage += reference.getValueOnPoint(point, agent.getThreshold()) / 1
 
         return np.exp(-sumOfCoverage)
+
+    def isZeroOutside(self) -> bool:
+        return True
+
+    def evaluateBatch(self, agents: List[Agent], points: np.ndarray, reference: Reference,
+                      inside: np.ndarray = None) -> np.ndarray:
+        evaluations = np.zeros(len(agents))
+        if len(agents) == 0:
+            return evaluations
+
+        xs, ys = points[:, :, 0], points[:, :, 1]
+        inBounds = np.zeros(len(agents), dtype=bool) if inside is None else inside.copy()
+        # Only agents not known to be inside need the per point bounds check
+        check = ~inBounds
+        inBounds[check] = ((xs[check] > 0) & (ys[check] > 0) & (xs[check] < reference.xMax())
+                           & (ys[check] < reference.yMax())).all(axis=1)
+
+        if inBounds.any():
+            thresholds = np.array([agent.getThreshold() for agent in agents])[inBounds, None]
+            coverage = reference.getValuesOnPoints(xs[inBounds], ys[inBounds], thresholds)
+            evaluations[inBounds] = np.exp(-coverage.sum(axis=1))
+
+        return evaluations
+
+    def evaluateNative(self, agents: List[Agent], reference: Reference, inside: np.ndarray = None) -> np.ndarray | None:
+        if not hasNativeEvaluation():
+            return None
+
+        evaluations = np.zeros(len(agents))
+        if len(agents) == 0:
+            return evaluations
+
+        # exp stays in numpy so scores match evaluateBatch bit for bit
+        coverage, inBounds = evaluateCurvesNative(agents, reference, inside)
+        evaluations[inBounds] = np.exp(-coverage[inBounds])
+
+        return evaluations
+
+    def evaluatePixels(self, agents: List[Agent], pixels: np.ndarray, offsets: np.ndarray,
+                       reference: Reference, inside: np.ndarray = None) -> np.ndarray:
+        evaluations = np.zeros(len(agents))
+        if len(agents) == 0:
+            return evaluations
+
+        owners = np.repeat(np.arange(len(agents)), np.diff(offsets))
+        xs, ys = pixels[:, 0], pixels[:, 1]
+        check = np.ones(len(pixels), dtype=bool) if inside is None else ~inside[owners]
+        outOfBounds = (xs[check] <= 0) | (ys[check] <= 0) | (xs[check] >= reference.xMax()) | (
+                ys[check] >= reference.yMax())
+        inBounds = np.bincount(owners[check][outOfBounds], minlength=len(agents)) == 0
+        valid = inBounds[owners]
+
+        if valid.any():
+            thresholds = np.array([agent.getThreshold() for agent in agents])[owners[valid]]
+            values = reference.getValuesOnPoints(xs[valid], ys[valid], thresholds)
+            coverage = np.bincount(owners[valid], weights=values, minlength=len(agents))
+            evaluations[inBounds] = np.exp(-coverage[inBounds])
+
+        return evaluations
@@ -1,5 +1,7 @@
 import random
 
+import numpy as np
+
 from genetics.basics import Agent
 from genetics.classes import BaseMutator
 
@@ -9,3 +11,6 @@ class NoiseMutator(BaseMutator):
         evaluationValue = agent.getEvaluationValue()
         factor = self._chance if evaluationValue == 0 else self._chance * evaluationValue
         return factor >= random.random()
+
+    def getBitChances(self, evaluations: np.ndarray) -> np.ndarray:
+        return np.where(evaluations == 0, self._chance, self._chance * evaluations)
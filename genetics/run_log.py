@@ -0,0 +1,212 @@
+import fcntl
+import os
+import struct
+import time
+from typing import Iterator, Tuple
+
+
+class RunLog:
+    """
+    Append-only container of a run. Payloads are appended to a data file and every append adds a fixed
+    size record (generation, offset, length, timestamp) to an index file, so any snapshot is found with one
+    index read. The payload is synced before its record, a record is visible only once it is complete and
+    a reopened writer cuts off whatever a crash left after the last complete record. There is one writer
+    per log, readers can follow it while it is written.
+    """
+    MAGIC = b"GENRUNLG"
+    VERSION = 1
+    DATA_SUFFIX = ".data"
+    INDEX_SUFFIX = ".index"
+
+    __header = struct.Struct("<8sII")
+    __record = struct.Struct("<qQQd")
+
+    __dataPath: str
+    __indexPath: str
+    __writable: bool
+    __sync: bool
+    __dataFd: int | None = None
+    __indexFd: int | None = None
+
+    def __init__(self, directory: str, name: str = "run", writable: bool = False, sync: bool = True):
+        self.__dataPath = os.path.join(directory, name + self.DATA_SUFFIX)
+        self.__indexPath = os.path.join(directory, name + self.INDEX_SUFFIX)
+        self.__writable = writable
+        self.__sync = sync
+
+        if writable:
+            self.__openWriter()
+
+    @classmethod
+    def exists(cls, directory: str, name: str = "run") -> bool:
+        return os.path.isfile(os.path.join(directory, name + cls.INDEX_SUFFIX))
+
+    def isWritable(self) -> bool:
+        return self.__writable
+
+    def getSize(self) -> int:
+        """Number of complete records, checked again on every call so readers see new appends"""
+        if not self.__openReader():
+            return 0
+
+        size = os.fstat(self.__indexFd).st_size - self.__header.size
+
+        return max(0, size // self.__record.size)
+
+    def getRecord(self, index: int) -> Tuple[int, int, int, float]:
+        """Generation, offset, length and timestamp of a record, negative indices count from the end"""
+        size = self.getSize()
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError(f"Record {index} is out of range, the log holds {size}.")
+
+        position = self.__header.size + index * self.__record.size
+
+        return self.__record.unpack(os.pread(self.__indexFd, self.__record.size, position))
+
+    def getLatestRecord(self) -> Tuple[int, int, int, float] | None:
+        return self.getRecord(-1) if self.getSize() > 0 else None
+
+    def findGeneration(self, generation: int) -> int | None:
+        """Index of the first record of a generation, generations never decrease along the log"""
+        low, high = 0, self.getSize()
+        while low < high:
+            middle = (low + high) // 2
+            if self.getRecord(middle)[0] < generation:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low if low < self.getSize() and self.getRecord(low)[0] == generation else None
+
+    def read(self, index: int) -> bytes:
+        _, offset, length, _ = self.getRecord(index)
+
+        return os.pread(self.__dataFd, length, offset)
+
+    def append(self, payload: bytes, generation: int = None) -> int:
+        """Append a payload, returns its record index. The generation defaults to the record index"""
+        if not self.__writable:
+            raise ValueError(f"Run log '{self.__indexPath}' is opened read-only.")
+
+        index = self.getSize()
+        offset = os.lseek(self.__dataFd, 0, os.SEEK_END)
+        os.write(self.__dataFd, payload)
+        if self.__sync:
+            os.fsync(self.__dataFd)
+
+        record = self.__record.pack(index if generation is None else generation, offset, len(payload), time.time())
+        os.pwrite(self.__indexFd, record, self.__header.size + index * self.__record.size)
+        if self.__sync:
+            os.fsync(self.__indexFd)
+
+        return index
+
+    def truncate(self, size: int) -> None:
+        """Drop every record from index size on together with its payload"""
+        if not self.__writable:
+            raise ValueError(f"Run log '{self.__indexPath}' is opened read-only.")
+
+        size = max(0, min(size, self.getSize()))
+        end = 0
+        if size > 0:
+            _, offset, length, _ = self.getRecord(size - 1)
+            end = offset + length
+
+        # The index shrinks first, readers never see a record without its payload
+        os.ftruncate(self.__indexFd, self.__header.size + size * self.__record.size)
+        os.ftruncate(self.__dataFd, end)
+        if self.__sync:
+            os.fsync(self.__indexFd)
+            os.fsync(self.__dataFd)
+
+    def tail(self, start: int = 0, pollInterval: float = 0.5, timeout: float | None = None) \
+            -> Iterator[Tuple[int, bytes]]:
+        """
+        Yield (index, payload) from record start on, waiting for records which are not written yet.
+        Stops once no record arrived for timeout seconds, never when timeout is None.
+        """
+        index = start
+        lastRecordTime = time.time()
+
+        while True:
+            if index < self.getSize():
+                yield index, self.read(index)
+                index += 1
+                lastRecordTime = time.time()
+                continue
+
+            if timeout is not None and time.time() - lastRecordTime >= timeout:
+                return
+
+            time.sleep(pollInterval)
+
+    def close(self) -> None:
+        for fd in (self.__dataFd, self.__indexFd):
+            if fd is not None:
+                os.close(fd)
+
+        self.__dataFd = self.__indexFd = None
+
+    def __del__(self):
+        self.close()
+
+    def __openReader(self) -> bool:
+        if self.__indexFd is not None:
+            return True
+
+        try:
+            indexFd = os.open(self.__indexPath, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+
+        header = os.pread(indexFd, self.__header.size, 0)
+        # The writer may not have written the header yet
+        if len(header) < self.__header.size:
+            os.close(indexFd)
+            return False
+
+        self.__checkHeader(header)
+        self.__indexFd = indexFd
+        self.__dataFd = os.open(self.__dataPath, os.O_RDONLY)
+
+        return True
+
+    def __openWriter(self) -> None:
+        self.__indexFd = os.open(self.__indexPath, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self.__indexFd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.close()
+            raise ValueError(f"Run log '{self.__indexPath}' is already opened by another writer.")
+
+        self.__dataFd = os.open(self.__dataPath, os.O_RDWR | os.O_CREAT, 0o644)
+
+        header = os.pread(self.__indexFd, self.__header.size, 0)
+        if len(header) < self.__header.size:
+            os.ftruncate(self.__indexFd, 0)
+            os.pwrite(self.__indexFd, self.__header.pack(self.MAGIC, self.VERSION, self.__record.size), 0)
+            os.fsync(self.__indexFd)
+        else:
+            self.__checkHeader(header)
+
+        self.__recover()
+
+    def __recover(self) -> None:
+        """Drop a torn record at the end of the index and any payload bytes without a record"""
+        size = self.getSize()
+        dataSize = os.fstat(self.__dataFd).st_size
+
+        while size > 0:
+            _, offset, length, _ = self.getRecord(size - 1)
+            if offset + length <= dataSize:
+                break
+            size -= 1
+
+        self.truncate(size)
+
+    def __checkHeader(self, header: bytes) -> None:
+        magic, version, recordSize = self.__header.unpack(header)
+        if magic != self.MAGIC or version > self.VERSION or recordSize != self.__record.size:
+            raise ValueError(f"Unsupported run log '{self.__indexPath}': {magic!r}, version {version}.")
@@ -0,0 +1,301 @@
+import math
+import os
+import pickle
+import shutil
+import tempfile
+import uuid
+import weakref
+from multiprocessing import Pool
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from genetics.basics import Reference, Point, Agent, FitnessFunction
+from genetics.classes import MainAgent, MainAgentPopulation, getValuesOnPoints, curveCache, boundsFilterCounters, \
+    setNativeThreads, NpyReference
+
+
+# Arrays mapped by this process, keyed by path, and the population they belong to
+_attachedArrays = {}
+_attachedToken: str | None = None
+
+
+def _attachPopulation(token: str) -> None:
+    """Unmap the arrays of earlier populations, their files may already be deleted by the executor"""
+    global _attachedToken
+    if token != _attachedToken:
+        _attachedArrays.clear()
+        _attachedToken = token
+
+
+class SharedArray:
+    """
+    NumPy array backed by a memory-mapped file. Pickling transfers only the path, shape and dtype,
+    the receiving process maps the same pages instead of copying the data.
+    """
+    __path: str
+    __shape: Tuple[int, ...]
+    __dtype: str
+    __array: np.ndarray | None
+
+    def __init__(self, path: str, shape: Tuple[int, ...], dtype: str, array: np.ndarray = None):
+        self.__path = path
+        self.__shape = tuple(shape)
+        self.__dtype = dtype
+        self.__array = array
+
+    @classmethod
+    def create(cls, directory: str, shape: Tuple[int, ...], dtype) -> "SharedArray":
+        path = os.path.join(directory, f"{uuid.uuid4().hex}.bin")
+        dtype = np.dtype(dtype).str
+        size = max(1, math.prod(shape)) * np.dtype(dtype).itemsize
+        with open(path, 'wb') as file:
+            file.truncate(size)
+
+        array = np.memmap(path, dtype=dtype, mode='r+', shape=tuple(shape))
+
+        return SharedArray(path, shape, dtype, array)
+
+    @classmethod
+    def fromArray(cls, directory: str, array: np.ndarray) -> "SharedArray":
+        sharedArray = SharedArray.create(directory, array.shape, array.dtype)
+        sharedArray.getArray()[...] = array
+
+        return sharedArray
+
+    def getArray(self) -> np.ndarray:
+        if self.__array is None:
+            if self.__path not in _attachedArrays:
+                _attachedArrays[self.__path] = np.memmap(self.__path, dtype=self.__dtype, mode='r', shape=self.__shape)
+            self.__array = _attachedArrays[self.__path]
+
+        return self.__array
+
+    def remove(self) -> None:
+        self.__array = None
+        os.remove(self.__path)
+
+    def __getstate__(self):
+        return self.__path, self.__shape, self.__dtype
+
+    def __setstate__(self, state):
+        self.__path, self.__shape, self.__dtype = state
+        self.__array = None
+
+
+class SharedReference(Reference):
+    __values: SharedArray
+    __summedAreaTable: SharedArray
+
+    def __init__(self, values: SharedArray, summedAreaTable: SharedArray):
+        self.__values = values
+        self.__summedAreaTable = summedAreaTable
+
+    @classmethod
+    def fromReference(cls, reference: Reference, directory: str) -> "SharedReference":
+        return SharedReference(
+            SharedArray.fromArray(directory, reference.getValues()),
+            SharedArray.fromArray(directory, reference.getSummedAreaTable())
+        )
+
+    def getValueOnPoint(self, point: Point, threshold: int = 0) -> int | float:
+        return float(self.getValuesOnPoints(np.array(point.getX()), np.array(point.getY()), np.array(threshold)))
+
+    def getValuesOnPoints(self, xs: np.ndarray, ys: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+        return getValuesOnPoints(self.getValues(), self.getSummedAreaTable(), xs, ys, thresholds)
+
+    def setValueOnPoint(self, value: int | float, point: Point) -> None:
+        raise NotImplementedError("SharedReference is read-only.")
+
+    def getValues(self) -> np.ndarray:
+        return self.__values.getArray()
+
+    def getSummedAreaTable(self) -> np.ndarray:
+        return self.__summedAreaTable.getArray()
+
+    def xMax(self) -> int:
+        return self.getValues().shape[1] - 1
+
+    def yMax(self) -> int:
+        return self.getValues().shape[0] - 1
+
+
+class SharedPopulation:
+    """MainAgentPopulation arrays placed in memory-mapped files, one row per agent."""
+    __genes: SharedArray
+    __lengths: SharedArray
+    __thresholds: SharedArray
+    __interpolationPoints: SharedArray
+    __evaluations: SharedArray
+    __alleleLength: int
+    __token: str
+
+    def __init__(self, directory: str, size: int, capacity: int, alleleLength: int):
+        self.__token = uuid.uuid4().hex
+        self.__genes = SharedArray.create(directory, (size, capacity), np.uint64)
+        self.__lengths = SharedArray.create(directory, (size,), np.int64)
+        self.__thresholds = SharedArray.create(directory, (size,), np.int64)
+        self.__interpolationPoints = SharedArray.create(directory, (size,), np.int64)
+        self.__evaluations = SharedArray.create(directory, (size,), np.float64)
+        self.__alleleLength = alleleLength
+
+    def getSize(self) -> int:
+        return self.__lengths.getArray().shape[0]
+
+    def getCapacity(self) -> int:
+        return self.__genes.getArray().shape[1]
+
+    def getAlleleLength(self) -> int:
+        return self.__alleleLength
+
+    def write(self, agents: List[Agent]) -> None:
+        """Write the agents into the leading rows, the remaining rows are left as they are"""
+        source = MainAgentPopulation.fromAgents(agents)
+        capacity = source.getCapacity()
+        size = len(agents)
+
+        self.__genes.getArray()[:size, :capacity] = source.getGenes()
+        self.__genes.getArray()[:size, capacity:] = 0
+        self.__lengths.getArray()[:size] = source.getLengths()
+        self.__thresholds.getArray()[:size] = source.getThresholds()
+        self.__interpolationPoints.getArray()[:size] = source.getInterpolationPoints()
+        self.__evaluations.getArray()[:size] = source.getEvaluations()
+
+    def getPopulation(self) -> MainAgentPopulation:
+        _attachPopulation(self.__token)
+
+        return MainAgentPopulation.fromArrays(
+            self.__genes.getArray(), self.__lengths.getArray(), self.__thresholds.getArray(),
+            self.__interpolationPoints.getArray(), self.__evaluations.getArray(), self.__alleleLength
+        )
+
+    def remove(self) -> None:
+        for sharedArray in (self.__genes, self.__lengths, self.__thresholds, self.__interpolationPoints,
+                            self.__evaluations):
+            sharedArray.remove()
+
+
+_workerReference: Reference | None = None
+
+
+def _initializeWorker(reference: Reference, curveCacheSize: int) -> None:
+    global _workerReference
+    _workerReference = reference
+    curveCache.setMaxSize(curveCacheSize)
+    # The pool already runs one worker per core
+    setNativeThreads(1)
+
+
+def evaluateRange(population: SharedPopulation, start: int, stop: int, evaluateBatch: Callable,
+                  fitnessFunctions: List[FitnessFunction], fitnessFunctionsWages: List[float],
+                  samplingMode: str = "uniform") -> Tuple[np.ndarray, Dict[str, int]]:
+    """Evaluate rows [start, stop) with evaluateBatch, returns evaluations and the counters of this call"""
+    before = _getWorkerCounters()
+    sharedPopulation = population.getPopulation()
+    agents = [MainAgent.fromPopulation(sharedPopulation, index) for index in range(start, stop)]
+    evals = evaluateBatch(agents, fitnessFunctions, fitnessFunctionsWages, _workerReference, samplingMode)
+
+    return evals, {key: value - before[key] for key, value in _getWorkerCounters().items()}
+
+
+def _getWorkerCounters() -> Dict[str, int]:
+    return {
+        "curveCacheHits": curveCache.getHits(),
+        "curveCacheMisses": curveCache.getMisses(),
+        "boundsOutside": boundsFilterCounters.getOutside(),
+        "boundsAmbiguous": boundsFilterCounters.getAmbiguous(),
+        "boundsInside": boundsFilterCounters.getInside(),
+    }
+
+
+class SharedMemoryExecutor:
+    """
+    Pool wrapper which hands the reference to the workers once, through the pool initializer, and keeps
+    the population genomes in a shared buffer. Tasks carry index ranges and return evaluation vectors.
+    """
+    __processes: int
+    __directory: str
+    __pool: "Pool | None" = None
+    __reference: Reference | None = None
+    __sharedReference: Reference | None = None
+    __population: SharedPopulation | None = None
+    __pickledBytes: int = 0
+    __curveCacheSize: int
+    __counters: Dict[str, int] = {}
+
+    def __init__(self, processes: int, curveCacheSize: int = 8192):
+        self.__processes = processes
+        self.__curveCacheSize = curveCacheSize
+        self.__directory = tempfile.mkdtemp(prefix='genetics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+        weakref.finalize(self, shutil.rmtree, self.__directory, True)
+
+    def evaluate(self, agents: List[Agent], evaluateBatch: Callable, fitnessFunctions: List[FitnessFunction],
+                 fitnessFunctionsWages: List[float], reference: Reference, chunkSize: int = 256,
+                 samplingMode: str = "uniform") -> np.ndarray:
+        if len(agents) == 0:
+            return np.zeros(0)
+
+        self.__prepareReference(reference)
+        population = self.__preparePopulation(agents)
+        population.write(agents)
+
+        tasks = [(population, start, min(start + chunkSize, len(agents)), evaluateBatch, fitnessFunctions,
+                  fitnessFunctionsWages, samplingMode) for start in range(0, len(agents), chunkSize)]
+        results = self.__pool.starmap(evaluateRange, tasks)
+
+        self.__pickledBytes = sum(len(pickle.dumps(task)) for task in tasks) + sum(
+            len(pickle.dumps(result)) for result in results)
+        self.__counters = {key: sum(counters[key] for _, counters in results) for key in results[0][1]}
+
+        return np.concatenate([evals for evals, _ in results])
+
+    def getPickledBytes(self) -> int:
+        """Bytes pickled between the main process and the workers by the last evaluate call"""
+        return self.__pickledBytes
+
+    def getCurveCacheCounters(self) -> Tuple[int, int]:
+        """Curve cache hits and misses of the workers during the last evaluate call"""
+        return self.__counters.get("curveCacheHits", 0), self.__counters.get("curveCacheMisses", 0)
+
+    def getBoundsFilterCounters(self) -> Tuple[int, int, int]:
+        """Curves classified outside, ambiguous and inside by the workers during the last evaluate call"""
+        return (self.__counters.get("boundsOutside", 0), self.__counters.get("boundsAmbiguous", 0),
+                self.__counters.get("boundsInside", 0))
+
+    def close(self) -> None:
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+        shutil.rmtree(self.__directory, ignore_errors=True)
+
+    def __prepareReference(self, reference: Reference) -> None:
+        if self.__reference is reference and self.__pool is not None:
+            return
+
+        if self.__pool is not None:
+            self.__pool.close()
+            self.__pool.join()
+
+        self.__reference = reference
+        # Binary references are memory-mapped files already, the workers map the same ones
+        if isinstance(reference, NpyReference):
+            self.__sharedReference = reference
+        else:
+            self.__sharedReference = SharedReference.fromReference(reference, self.__directory)
+        self.__pool = Pool(processes=self.__processes, initializer=_initializeWorker,
+                           initargs=(self.__sharedReference, self.__curveCacheSize))
+
+    def __preparePopulation(self, agents: List[Agent]) -> SharedPopulation:
+        alleleLength = agents[0].getAlleleLength()
+        capacity = max(agent.getLength() // alleleLength for agent in agents)
+        population = self.__population
+
+        if (population is None or population.getSize() < len(agents) or population.getCapacity() < capacity
+                or population.getAlleleLength() != alleleLength):
+            if population is not None:
+                population.remove()
+            self.__population = SharedPopulation(self.__directory, len(agents), capacity, alleleLength)
+
+        return self.__population
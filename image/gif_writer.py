@@ -0,0 +1,74 @@
+from typing import BinaryIO, Tuple
+
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+GRAY_PALETTE = np.repeat(np.arange(256, dtype=np.uint8), 3).tobytes()
+
+
+class GifWriter:
+    """
+    Animated grayscale GIF written frame by frame, only the previous frame is kept in memory. Every frame
+    indexes one global palette of the 256 gray levels, so no frame is quantized, and every frame after the
+    first stores only the rectangle which differs from the frame before it.
+    """
+    __file: BinaryIO
+    __duration: int
+    __loop: int
+    __previous: np.ndarray | None = None
+
+    def __init__(self, path: str, duration: int = 100, loop: int = 0):
+        """duration of a frame in milliseconds, loop 0 repeats the animation forever"""
+        self.__file = open(path, 'wb')
+        self.__duration = duration
+        self.__loop = loop
+
+    def append(self, frame: np.ndarray) -> None:
+        """Add a frame of gray values, shape (height, width) as uint8"""
+        if frame.ndim != 2 or frame.dtype != np.uint8:
+            raise ValueError(f"Frames must be 2D uint8 gray values, got {frame.dtype} of shape {frame.shape}.")
+
+        if self.__previous is None:
+            image = self.__createImage(frame)
+            header, _ = GifImagePlugin.getheader(image, info={"loop": self.__loop, "duration": self.__duration})
+            self.__write(header)
+            offset = (0, 0)
+        else:
+            if frame.shape != self.__previous.shape:
+                raise ValueError(f"Frame of shape {frame.shape} does not match the animation {self.__previous.shape}.")
+
+            top, bottom, left, right = self.__getChangedBox(self.__previous, frame)
+            image = self.__createImage(frame[top:bottom, left:right])
+            offset = (left, top)
+
+        # Disposal 1 keeps the frame on the canvas, the next rectangle is drawn over it
+        self.__write(GifImagePlugin.getdata(image, offset, duration=self.__duration, disposal=1))
+        self.__previous = frame
+
+    def close(self) -> None:
+        if not self.__file.closed:
+            self.__file.write(b";")
+            self.__file.close()
+
+    def __write(self, chunks) -> None:
+        for chunk in chunks:
+            self.__file.write(chunk)
+
+    @staticmethod
+    def __createImage(frame: np.ndarray) -> Image.Image:
+        image = Image.fromarray(np.ascontiguousarray(frame), "P")
+        image.putpalette(GRAY_PALETTE)
+
+        return image
+
+    @staticmethod
+    def __getChangedBox(previous: np.ndarray, frame: np.ndarray) -> Tuple[int, int, int, int]:
+        """Top, bottom, left and right of the changed pixels, a single pixel when nothing changed"""
+        changed = previous != frame
+        rows = np.flatnonzero(changed.any(axis=1))
+        if len(rows) == 0:
+            return 0, 1, 0, 1
+
+        columns = np.flatnonzero(changed[rows[0]:rows[-1] + 1].any(axis=0))
+
+        return int(rows[0]), int(rows[-1]) + 1, int(columns[0]), int(columns[-1]) + 1
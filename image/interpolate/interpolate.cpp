@@ -1,6 +1,11 @@
+#include <algorithm>
 #include <array>
+#include <cmath>
 #include <cstdlib>
 #include <vector>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
 
 extern "C" {
 double* interpolate(double t, double points[][2], int size)
@@ -68,4 +73,172 @@ void reset(double* pkt)
 {
     free(pkt);
 }
+
+// de Casteljau evaluation of a curve given as x, y pairs, dCpts holds 2 * size doubles
+static void deCasteljau(double t, const double* points, int size, double* dCpts, double* res)
+{
+    for (int i = 0; i < 2 * size; ++i) {
+        dCpts[i] = points[i];
+    }
+    for (int count = size; count > 1; --count) {
+        for (int i = 0; i < count - 1; i++) {
+            dCpts[2 * i] = dCpts[2 * i] + (dCpts[2 * i + 2] - dCpts[2 * i]) * t;
+            dCpts[2 * i + 1] = dCpts[2 * i + 1] + (dCpts[2 * i + 3] - dCpts[2 * i + 1]) * t;
+        }
+    }
+    res[0] = dCpts[0];
+    res[1] = dCpts[1];
+}
+
+static bool nearRoundingTie(double value)
+{
+    return std::fabs(value - std::floor(value) - 0.5) <= 1e-7 * std::max(1.0, std::fabs(value));
+}
+
+// Pairwise summation in the order numpy uses, so sums match ndarray.sum bit for bit
+static double pairwiseSum(const double* a, long long n)
+{
+    if (n < 8) {
+        double res = -0.0;
+        for (long long i = 0; i < n; i++) {
+            res += a[i];
+        }
+        return res;
+    }
+    if (n <= 128) {
+        double r[8];
+        for (int j = 0; j < 8; j++) {
+            r[j] = a[j];
+        }
+        long long i;
+        for (i = 8; i < n - (n % 8); i += 8) {
+            for (int j = 0; j < 8; j++) {
+                r[j] += a[i + j];
+            }
+        }
+        double res = ((r[0] + r[1]) + (r[2] + r[3])) + ((r[4] + r[5]) + (r[6] + r[7]));
+        for (; i < n; i++) {
+            res += a[i];
+        }
+        return res;
+    }
+    long long n2 = n / 2;
+    n2 -= n2 % 8;
+    return pairwiseSum(a, n2) + pairwiseSum(a + n2, n - n2);
+}
+
+static double windowAverage(const double* summedAreaTable, int width, int height, long long x, long long y,
+                            long long threshold)
+{
+    // Windows span [max(0, c - r), min(cMax, c + r + 1)) like getWindowAverages
+    long long xMax = width - 1, yMax = height - 1, radius = threshold / 2;
+    long long xMin = std::min(std::max(x - radius, 0LL), xMax);
+    long long yMin = std::min(std::max(y - radius, 0LL), yMax);
+    long long xEnd = std::min(std::max(x + radius + 1, xMin), xMax);
+    long long yEnd = std::min(std::max(y + radius + 1, yMin), yMax);
+    long long area = (xEnd - xMin) * (yEnd - yMin);
+    if (area <= 0) {
+        return 0;
+    }
+
+    long long stride = width + 1;
+    double total = summedAreaTable[yEnd * stride + xEnd] - summedAreaTable[yMin * stride + xEnd]
+        - summedAreaTable[yEnd * stride + xMin] + summedAreaTable[yMin * stride + xMin];
+
+    return total / (double)area;
+}
+
+/*
+ * Sample, round and bounds-check every curve and sum the reference values on its samples.
+ * Control points of curve i are points[2 * offsets[i]] .. points[2 * offsets[i + 1]] (x, y pairs).
+ * The Bernstein basis for curves of size control points is the (numberOfTs, size) matrix starting at
+ * bases[basisOffsets[size]], samples near a .5 rounding tie are recomputed with de Casteljau like
+ * _interpolateGroup does. Values have shape (height, width), either values as doubles or storedValues
+ * as bytes divided by scale, and summedAreaTable (height + 1, width + 1). Curves with inside set skip
+ * the check of 0 < x < xMax, 0 < y < yMax. coverage receives the sums and inBounds whether every sample
+ * was inside.
+ */
+static void evaluateCurvesOn(const double* points, const long long* offsets, long long agents, const double* bases,
+                             const long long* basisOffsets, const double* ts, int numberOfTs, const double* values,
+                             const unsigned char* storedValues, double scale, const double* summedAreaTable,
+                             int width, int height, int xMax, int yMax, const long long* thresholds,
+                             const unsigned char* inside, double* coverage, unsigned char* inBounds)
+{
+    long long maxSize = 0;
+    for (long long i = 0; i < agents; i++) {
+        maxSize = std::max(maxSize, offsets[i + 1] - offsets[i]);
+    }
+
+    #pragma omp parallel
+    {
+        std::vector<double> dCpts(2 * maxSize);
+        std::vector<double> samples(numberOfTs);
+
+        #pragma omp for schedule(dynamic, 16)
+        for (long long i = 0; i < agents; i++) {
+            const double* curve = points + 2 * offsets[i];
+            int size = (int)(offsets[i + 1] - offsets[i]);
+            const double* basis = bases + basisOffsets[size];
+            bool valid = true;
+
+            for (int k = 0; k < numberOfTs; k++) {
+                const double* row = basis + (long long)k * size;
+                double res[2] = { row[0] * curve[0], row[0] * curve[1] };
+                for (int j = 1; j < size; j++) {
+                    res[0] = res[0] + row[j] * curve[2 * j];
+                    res[1] = res[1] + row[j] * curve[2 * j + 1];
+                }
+                if (size > 4 && (nearRoundingTie(res[0]) || nearRoundingTie(res[1]))) {
+                    deCasteljau(ts[k], curve, size, dCpts.data(), res);
+                }
+
+                double x = std::nearbyint(res[0]);
+                double y = std::nearbyint(res[1]);
+
+                if (!inside[i] && !(x > 0 && y > 0 && x < xMax && y < yMax)) {
+                    valid = false;
+                    break;
+                }
+
+                long long xi = (long long)x, yi = (long long)y;
+                // Divided like getValuesOnPoints divides the stored values, the result is the same double
+                samples[k] = thresholds[i] > 1
+                    ? windowAverage(summedAreaTable, width, height, xi, yi, thresholds[i])
+                    : storedValues != nullptr ? (double)storedValues[yi * width + xi] / scale
+                    : values[yi * width + xi];
+            }
+
+            inBounds[i] = valid;
+            coverage[i] = valid ? pairwiseSum(samples.data(), numberOfTs) : 0;
+        }
+    }
+}
+
+void evaluateCurves(const double* points, const long long* offsets, long long agents, const double* bases,
+                    const long long* basisOffsets, const double* ts, int numberOfTs, const double* values,
+                    const double* summedAreaTable, int width, int height, int xMax, int yMax,
+                    const long long* thresholds, const unsigned char* inside, double* coverage,
+                    unsigned char* inBounds)
+{
+    evaluateCurvesOn(points, offsets, agents, bases, basisOffsets, ts, numberOfTs, values, nullptr, 1,
+                     summedAreaTable, width, height, xMax, yMax, thresholds, inside, coverage, inBounds);
+}
+
+// evaluateCurves reading a uint8 reference in place, each value divided by scale
+void evaluateCurvesScaled(const double* points, const long long* offsets, long long agents, const double* bases,
+                          const long long* basisOffsets, const double* ts, int numberOfTs,
+                          const unsigned char* storedValues, double scale, const double* summedAreaTable, int width,
+                          int height, int xMax, int yMax, const long long* thresholds, const unsigned char* inside,
+                          double* coverage, unsigned char* inBounds)
+{
+    evaluateCurvesOn(points, offsets, agents, bases, basisOffsets, ts, numberOfTs, nullptr, storedValues, scale,
+                     summedAreaTable, width, height, xMax, yMax, thresholds, inside, coverage, inBounds);
+}
+
+void setNumberOfThreads(int threads)
+{
+#ifdef _OPENMP
+    omp_set_num_threads(threads);
+#endif
+}
 }
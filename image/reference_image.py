@@ -1,49 +1,121 @@
+import hashlib
 import json
+import os
+import tempfile
 from pathlib import Path
-from typing import List
 
 import numpy as np
 from skimage import io, color, feature, exposure
 from skimage.filters import gaussian
 from skimage.util import img_as_ubyte
 
+from genetics.classes import NpyReference
+
+
+class EdgeMatrixCache:
+    """
+    Edge matrices stored as .npy files, keyed by the content hash of the image and the edge detection
+    parameters, so regenerating a reference with parameters used before skips the edge detection.
+    """
+    __directory: str
+
+    def __init__(self, directory: str):
+        self.__directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def createKey(imagePath: Path, cannySigma: float, blur: bool, blurSigma: float) -> str:
+        digest = hashlib.sha256()
+        with open(imagePath, 'rb') as imageFile:
+            for chunk in iter(lambda: imageFile.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(json.dumps([float(cannySigma), bool(blur), float(blurSigma)]).encode())
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> np.ndarray | None:
+        try:
+            return np.load(self.__getPath(key))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, key: str, edges: np.ndarray) -> None:
+        # Written aside and renamed, so processes sharing the cache never read a partial file
+        fd, temporaryPath = tempfile.mkstemp(dir=self.__directory, suffix='.npy')
+        with os.fdopen(fd, 'wb') as cacheFile:
+            np.save(cacheFile, edges)
+        os.replace(temporaryPath, self.__getPath(key))
+
+    def __getPath(self, key: str) -> str:
+        return os.path.join(self.__directory, f"{key}.npy")
+
 
 class EdgeMatrixCreator:
     __imagePath: Path
     __outputPath: Path
+    __edges: np.ndarray | None = None
 
     def __init__(self, imagePath: Path, outputPath: Path):
         self.__imagePath = imagePath
         self.__outputPath = outputPath
 
-    def createEdgeMatrix(self, cannySigma: float, blur: bool, blurSigma: float):
-        image = io.imread(self.__imagePath)
+    def createEdgeMatrix(self, cannySigma: float, blur: bool, blurSigma: float,
+                         cache: EdgeMatrixCache = None) -> np.ndarray:
+        """Edge matrix as uint8, kept in memory for the reference and saved as a preview image"""
+        key = EdgeMatrixCache.createKey(self.__imagePath, cannySigma, blur, blurSigma) if cache else None
+        edges = cache.get(key) if cache else None
 
-        if image.ndim == 3:
-            image = color.rgb2gray(image)
+        if edges is None:
+            image = io.imread(self.__imagePath)
 
-        edges = feature.canny(image, sigma=cannySigma)
+            if image.ndim == 3:
+                image = color.rgb2gray(image)
 
-        if blur:
-            edges = gaussian(edges, sigma=blurSigma)
+            edges = feature.canny(image, sigma=cannySigma)
 
-        edges = edges / np.max(edges)
-        edges[edges >= 0.25] = 1
+            if blur:
+                edges = gaussian(edges, sigma=blurSigma)
 
-        io.imsave(self.__outputPath, img_as_ubyte(edges))
+            edges = edges / np.max(edges)
+            edges[edges >= 0.25] = 1
+            edges = img_as_ubyte(edges)
 
-    def createReferenceJson(self, path: Path):
-        image = io.imread(self.__outputPath)
-        height, width = image.shape[:2]
+            if cache:
+                cache.put(key, edges)
 
-        referenceData: List[List[float]] = []
+        self.__edges = edges
+        io.imsave(self.__outputPath, edges, check_contrast=False)
 
-        for row in image:
-            columnValues = []
-            for column in row:
-                bwValue = column / 255
-                columnValues.append(bwValue)
-            referenceData.append(columnValues)
+        return edges
+
+    def createReferenceJson(self, path: Path):
+        edges = self.__getEdges()
+        height, width = edges.shape[:2]
 
         with open(path, 'w') as jsonFile:
-            json.dump({"xMax": width, "yMax": height, "pointsValues": referenceData}, jsonFile)
+            json.dump({"xMax": width, "yMax": height, "pointsValues": (edges / 255).tolist()}, jsonFile)
+
+    def createReferenceNpy(self, path: Path) -> NpyReference:
+        """Binary reference of the edge matrix, the same values as createReferenceJson stored as uint8"""
+        return NpyReference.create(str(path), self.__getEdges(), 255)
+
+    def __getEdges(self) -> np.ndarray:
+        # Without createEdgeMatrix in this process the preview image written before is used
+        if self.__edges is None:
+            self.__edges = img_as_ubyte(io.imread(self.__outputPath))
+
+        return self.__edges
+
+
+def createReference(imagePath: Path, cannySigma: float, blur: bool, blurSigma: float,
+                    cacheDirectory: str = None) -> Path:
+    """Edge matrix preview and reference.npy of an image, written next to the image"""
+    outputPath = imagePath.with_name(f"{imagePath.stem}_em{imagePath.suffix}")
+    referencePath = imagePath.with_name("reference.npy")
+    cache = EdgeMatrixCache(cacheDirectory) if cacheDirectory else None
+
+    creator = EdgeMatrixCreator(imagePath, outputPath)
+    creator.createEdgeMatrix(cannySigma, blur, blurSigma, cache)
+    creator.createReferenceNpy(referencePath)
+
+    return referencePath
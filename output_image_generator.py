@@ -1,41 +1,58 @@
 import math
 import os
-import subprocess
 import sys
+from collections import deque
+from functools import lru_cache
+from multiprocessing import Pool
 from pathlib import Path
-from typing import List
+from typing import Iterator, List, Tuple
 
 import numpy as np
-import matplotlib.pyplot as plt
+from PIL import Image
 
 from genetics.basics import Agent
-from genetics.classes import JsonMainAgentStateAdapter, JsonReference
+from genetics.classes import MainAgent, MainAgentPopulation, RunLogMainAgentStateAdapter, interpolateAgents, \
+    openReference, sampleAgentsAdaptive
+from image.gif_writer import GifWriter
 
 main_directory = Path(__file__).resolve().parent
 outPath = f"{main_directory}/__out"
 
+BLEND_MODES = ("last", "max")
+# zlib level of the frames, higher levels spend more time than writing the bigger file takes
+PNG_COMPRESS_LEVEL = 3
+# Milliseconds per frame of the gif
+GIF_FRAME_DURATION = 100
+# Frames per process rendered or waiting to be written at once
+FRAMES_IN_FLIGHT = 2
+# Stamp pixels composited at once, bounds the memory of compositeStamps
+STAMP_BATCH_SIZE = 1 << 22
+
 
 agentsPrinted = []
 
 def main():
     if len(sys.argv) < 1:
-        print("Usage: python output__image_generator.py [filepath] [version] [scale] [minEvaluation] [legacyMode]")
+        print("Usage: python output__image_generator.py [filepath] [version] [scale] [minEvaluation] [legacyMode] "
+              "[--samplingMode uniform|adaptive] [--processes n]")
         sys.exit(1)
 
-    filepath = str(sys.argv[1])
-    version = str(sys.argv[2])
+    arguments = sys.argv[1:]
+    samplingMode = popOption(arguments, "--samplingMode", "uniform")
+    processes = int(popOption(arguments, "--processes", os.cpu_count() or 1))
+
+    filepath = str(arguments[0])
+    version = str(arguments[1])
     scale = 1
-    minEvaluation = 0.5
+    minEvaluations = [0.5]
     legacyMode = False
 
-    if len(sys.argv) > 3:
-        scale = int(sys.argv[3])
-    if len(sys.argv) > 4:
-        minEvaluation = float(sys.argv[4])
-    if len(sys.argv) > 5:
-        legacyMode = bool(sys.argv[5])
-
-    referencePath = f"{outPath}/{filepath}/reference.json"
+    if len(arguments) > 2:
+        scale = int(arguments[2])
+    if len(arguments) > 3:
+        minEvaluations = [float(minEvaluation) for minEvaluation in arguments[3].split(',')]
+    if len(arguments) > 4:
+        legacyMode = arguments[4].lower() in ("1", "true")
 
     inputPath = ''
     if len(version) == 10:
@@ -43,115 +60,272 @@ def main():
     else:
         inputPath = f"{outPath}/{filepath}/{version}"
 
-    stateAdapter = JsonMainAgentStateAdapter(inputPath, filepath, legacyMode)
-    reference = JsonReference(referencePath)
+    stateAdapter = RunLogMainAgentStateAdapter(inputPath, filepath, legacyMode)
+    reference = openReference(f"{outPath}/{filepath}")
+    if reference is None:
+        print(f"Reference does not exist in {outPath}/{filepath}")
+        sys.exit(1)
 
-    iterator = 0
-    agents = stateAdapter.load(iterator)
-    imagePaths = []
+    imagesPaths = [f"{inputPath}/images-{str(minEvaluation)}" for minEvaluation in minEvaluations]
+    for imagesPath in imagesPaths:
+        if not os.path.exists(imagesPath):
+            os.makedirs(imagesPath)
+
+    width = reference.xMax() * scale
+    height = reference.yMax() * scale
+
+    # Snapshots are read one at a time and only the agents which are printed are sent to the workers
+    tasks = ((snapshot["index"], MainAgentPopulation.fromAgents(snapshot["agents"]), imagesPaths, width, height,
+              minEvaluations, scale, samplingMode)
+             for snapshot in stateAdapter.readSnapshots(("agents",), min(minEvaluations)))
+
+    printedAgents = []
+    frames = []
+    gifWriters = []
+    try:
+        for iterator, printed, snapshotFrames in renderFrames(tasks, processes):
+            print(iterator)
+            printedAgents.append(printed)
+            frames.append(snapshotFrames)
+
+            # The gifs are only created for more than two frames, after that every frame is written right away
+            if len(frames) > 2 or gifWriters:
+                if not gifWriters:
+                    gifWriters = [GifWriter(f"{inputPath}/result-{minEvaluation}.gif", GIF_FRAME_DURATION)
+                                  for minEvaluation in minEvaluations]
+                for bufferedFrames in frames:
+                    for gifWriter, frame in zip(gifWriters, bufferedFrames):
+                        gifWriter.append(frame)
+                frames = []
+    finally:
+        for gifWriter in gifWriters:
+            gifWriter.close()
+
+    for position, (imagesPath, minEvaluation) in enumerate(zip(imagesPaths, minEvaluations)):
+        with open(f'{imagesPath}/agentsPrinted-{str(minEvaluation)}.csv', 'w') as file:
+            file.write("Index, Agents\n")
+            for i in range(0, len(printedAgents)):
+                index = i
+                agents = printedAgents[i][position]
+                file.write(f"{index}, {agents}\n")
+
+
+def popOption(arguments: List[str], name: str, default):
+    """Remove a named option and its value from the arguments, default when it is not given"""
+    if name not in arguments:
+        return default
+
+    position = arguments.index(name)
+    if position + 1 >= len(arguments):
+        print(f"Missing the value after {name}")
+        sys.exit(1)
 
-    imagesPath = f"{inputPath}/images-{str(minEvaluation)}"
-    if not os.path.exists(imagesPath):
-        os.makedirs(imagesPath)
+    value = arguments[position + 1]
+    del arguments[position:position + 2]
 
-    while len(agents) > 0:
-        print(iterator)
-        imagePath = f"{imagesPath}/{iterator}.png"
-        width = reference.xMax() * scale
-        height = reference.yMax() * scale
+    return value
 
-        image = createImage(width, height, agents, minEvaluation, scale)
 
-        dpi = 300
-        plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+def renderFrames(tasks: Iterator[Tuple], processes: int) -> Iterator[Tuple[int, List[int], List[np.ndarray]]]:
+    """
+    Render the tasks of renderFrame across processes, results are yielded in the order of the tasks. At most
+    FRAMES_IN_FLIGHT frames per process are rendered or wait to be yielded, further tasks are not read before.
+    """
+    if processes <= 1:
+        yield from map(renderFrame, tasks)
+        return
 
-        plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-        plt.imshow(image, extent=(0, width, 0, height))
-        plt.axis('off')
-        # plt.show()
-        plt.savefig(imagePath, format='png', transparent=True, bbox_inches='tight', pad_inches=0)
-        plt.close()
+    with Pool(processes=processes) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(renderFrame, (task,)))
+            if len(pending) >= FRAMES_IN_FLIGHT * processes:
+                yield pending.popleft().get()
 
-        imagePaths.append(imagePath)
+        while pending:
+            yield pending.popleft().get()
 
-        iterator += 1
-        agents = stateAdapter.load(iterator)
 
-    # Create gif
-    if len(imagePaths) > 2:
-        image_files = sorted([f for f in os.listdir(imagesPath) if f.endswith('.png')],
-                             key=lambda x: int(os.path.splitext(x)[0]))
+def renderFrame(task: Tuple) -> Tuple[int, List[int], List[np.ndarray]]:
+    """
+    Create and save the images of a snapshot for every minEvaluation, returns its index, the agents printed
+    and the gif frame for each of them
+    """
+    index, population, imagesPaths, width, height, minEvaluations, scale, samplingMode = task
+    agents = population.getAgents()
 
-        cmd = [
-            "convert",
-            "-delay", str(10),
-            "-loop", str(0),
-        ]
+    images = createImages(width, height, agents, minEvaluations, scale, samplingMode)
+    for image, imagesPath in zip(images, imagesPaths):
+        saveImage(image, f"{imagesPath}/{index}.png")
 
-        # Add image filenames to the command
-        cmd.extend([f"{imagesPath}/{filename}" for filename in image_files])
+    printed = [sum(agent.getEvaluationValue() >= minEvaluation for agent in agents) for minEvaluation in minEvaluations]
 
-        cmd.extend([
-            "-alpha", "set",
-            f"{inputPath}/result-{minEvaluation}.gif"
-        ])
+    return index, printed, [toGrayFrame(image) for image in images]
 
-        # Run the command
-        subprocess.run(cmd)
 
-    with open(f'{imagesPath}/agentsPrinted-{str(minEvaluation)}.csv', 'w') as file:
-        file.write("Index, Agents\n")
-        for i in range(0, len(agentsPrinted)):
-            index = i
-            agents = agentsPrinted[i]
-            file.write(f"{index}, {agents}\n")
+def toGrayFrame(image: np.ndarray) -> np.ndarray:
+    """Gray values of an RGBA image of createImage laid over white"""
+    transparency = (255 - image[:, :, 0].astype(np.uint16)) * image[:, :, 3] // 255
 
+    return (255 - transparency).astype(np.uint8)
 
-def createImage(width: int, height: int, agents: List[Agent], minEvaluation: float = .0, scale: int = 1):
-    image = np.zeros((height, width, 4), dtype=np.uint8)
-    image[:, :, :3] = 255
-    image[:, :, 3] = 255
 
-    agentsPrintedInIteration = 0
+def createImage(width: int, height: int, agents: List[Agent], minEvaluation: float = .0, scale: int = 1,
+                samplingMode: str = "uniform", blendMode: str = "last"):
+    """
+    Draw every printed agent as stamps of its alpha kernel, one stamp per sampled point. With blendMode "last"
+    a pixel keeps the alpha of the last stamp covering it, in the order the agents and points are drawn,
+    with "max" it keeps the highest alpha of all stamps covering it.
+    """
+    agentsPrinted.append(sum(agent.getEvaluationValue() >= minEvaluation for agent in agents))
+
+    return createImages(width, height, agents, [minEvaluation], scale, samplingMode, blendMode)[0]
 
-    for agent in agents:
-        color = (0, 0, 0, 255)
-        step = agent.getStep()
-        arrange = np.arange(0, 1 + step, step)
-        points = []
 
-        if agent.getEvaluationValue() < minEvaluation:
-            continue
+def createImages(width: int, height: int, agents: List[Agent], minEvaluations: List[float], scale: int = 1,
+                 samplingMode: str = "uniform", blendMode: str = "last") -> List[np.ndarray]:
+    """
+    The image createImage draws for each of minEvaluations, in the same order. Every curve is sampled once and
+    agents are composited from the highest evaluation down, an image is taken whenever a minEvaluation is passed.
+    """
+    if blendMode not in BLEND_MODES:
+        raise ValueError(f"Unknown blend mode '{blendMode}', expected one of {BLEND_MODES}.")
+    if not minEvaluations:
+        return []
 
-        agentsPrintedInIteration += 1
-        for t in arrange:
-            point = agent.getPointForT(t)
-            points.append(point)
+    printed = [agent for agent in agents if agent.getEvaluationValue() >= min(minEvaluations)]
+    evaluations = np.array([agent.getEvaluationValue() for agent in printed], dtype=float)
 
-        threshold = agent.getThreshold()
-        threshold = math.floor((threshold * scale) / 2)
+    # Adaptive mode samples every printed curve once per pixel it passes through
+    if samplingMode == "adaptive":
+        pixels, offsets = sampleAgentsAdaptive(printed, 2 * (width + height) // scale)
+        pointsByAgent = [pixels[offsets[i]:offsets[i + 1]] for i in range(len(printed))]
+    else:
+        pointsByAgent = getUniformPoints(printed)
+
+    thresholds = np.array([math.floor((agent.getThreshold() * scale) / 2) for agent in printed], dtype=np.int64)
+    lengths = np.array([len(agentPoints) for agentPoints in pointsByAgent], dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(lengths)))
 
-        maxDistance = threshold * math.sqrt(2)
+    alpha = np.full(height * width, -1, dtype=np.int64)
+    lastStamp = np.full(height * width, -1, dtype=np.int64) if blendMode == "last" else None
+    order = np.argsort(-evaluations, kind="stable")
+    images = {}
+    composited = 0
 
-        for point in points:
-            x, y = point.getX() * scale, point.getY() * scale
-            xMin, xMax, yMin, yMax = max(0, x - threshold), min(width, x + threshold + 1), max(0, y - threshold), min(
-                height, y + threshold + 1)
+    for minEvaluation in sorted(set(minEvaluations), reverse=True):
+        # Agents of minEvaluation not composited for a higher one, stamps keep the indices of the drawing order
+        batch = order[composited:np.count_nonzero(evaluations >= minEvaluation)]
+        if len(batch) > 0:
+            points = np.concatenate([pointsByAgent[position] for position in batch]) * scale
+            stamps = np.concatenate([np.arange(offsets[position], offsets[position + 1]) for position in batch])
+            compositeStamps(alpha, width, height, points, np.repeat(thresholds[batch], lengths[batch]), blendMode,
+                            stamps, lastStamp)
+            composited += len(batch)
 
-            for yy in range(yMin, yMax):
-                for xx in range(xMin, xMax):
-                    alpha = 255
-                    distance = math.sqrt((x - xx) ** 2 + (y - yy) ** 2)
+        images[minEvaluation] = toImage(alpha, width, height)
 
-                    if distance > 0:
-                        alpha = int(calculateAlpha(distance, maxDistance))
+    return [images[minEvaluation] for minEvaluation in minEvaluations]
 
-                    image[yy][xx] = (color[0], color[1], color[2], alpha)
-    agentsPrinted.append(agentsPrintedInIteration)
+
+def toImage(alpha: np.ndarray, width: int, height: int) -> np.ndarray:
+    """White RGBA image with black pixels of the given alpha, where alpha is not negative"""
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[:, :, :3] = 255
+    image[:, :, 3] = 255
+
+    covered = alpha >= 0
+    image.reshape(-1, 4)[covered] = 0
+    image.reshape(-1, 4)[covered, 3] = alpha[covered]
 
     return image
 
 
+def getUniformPoints(agents: List[Agent]) -> List[np.ndarray]:
+    """Points of agents at t = 0, step, 2 * step, ..., 1, agents with the default step are sampled in batches"""
+    pointsByAgent: List[np.ndarray | None] = [None] * len(agents)
+    groups = {}
+
+    for position, agent in enumerate(agents):
+        if isinstance(agent, MainAgent) and agent.getStep() == 1 / agent.getNumberOfInterpolationPoints():
+            groups.setdefault(agent.getNumberOfInterpolationPoints(), []).append(position)
+        else:
+            step = agent.getStep()
+            agentPoints = [agent.getPointForT(t) for t in np.arange(0, 1 + step, step)]
+            pointsByAgent[position] = np.array([(point.getX(), point.getY()) for point in agentPoints],
+                                               dtype=np.int64).reshape(-1, 2)
+
+    for positions in groups.values():
+        for position, agentPoints in zip(positions, interpolateAgents([agents[position] for position in positions])):
+            pointsByAgent[position] = agentPoints
+
+    return pointsByAgent
+
+
+@lru_cache(maxsize=None)
+def getStampKernel(threshold: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Offsets (dy, dx) and alphas of a stamp, the alpha of each offset as calculateAlpha gives it"""
+    maxDistance = threshold * math.sqrt(2)
+    dy, dx = np.divmod(np.arange((2 * threshold + 1) ** 2), 2 * threshold + 1)
+    dy, dx = dy - threshold, dx - threshold
+    alphas = [255 if distance == 0 else int(calculateAlpha(distance, maxDistance))
+              for distance in (math.sqrt(y ** 2 + x ** 2) for y, x in zip(dy.tolist(), dx.tolist()))]
+
+    for array in (dy, dx):
+        array.setflags(write=False)
+
+    return dy, dx, np.array(alphas, dtype=np.int64)
+
+
+def compositeStamps(alpha: np.ndarray, width: int, height: int, points: np.ndarray, thresholds: np.ndarray,
+                    blendMode: str = "last", stamps: np.ndarray = None, lastStamp: np.ndarray = None) -> None:
+    """
+    Stamp the kernel of thresholds[i] at points[i] (x, y) into the flat alpha buffer, pixels outside the image
+    are cut off. stamps numbers the points in drawing order, by default their positions. With "last" the stamp
+    with the highest number covering a pixel is the one which is kept, lastStamp holds that number per pixel
+    and is passed again to composite further stamps in any order. Stamps are composited in batches of at most
+    STAMP_BATCH_SIZE pixels.
+    """
+    if stamps is None:
+        stamps = np.arange(len(points), dtype=np.int64)
+    if lastStamp is None and blendMode == "last":
+        lastStamp = np.full(len(alpha), -1, dtype=np.int64)
+    start = 0
+
+    while start < len(points):
+        size = max(1, STAMP_BATCH_SIZE // (2 * int(thresholds[start:start + STAMP_BATCH_SIZE].max()) + 1) ** 2)
+        stop = min(len(points), start + size)
+        pixels, pixelStamps, alphas = [], [], []
+
+        for threshold in np.unique(thresholds[start:stop]):
+            positions = start + np.flatnonzero(thresholds[start:stop] == threshold)
+            dy, dx, kernel = getStampKernel(int(threshold))
+            xs = points[positions, 0][:, None] + dx
+            ys = points[positions, 1][:, None] + dy
+            inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+
+            pixels.append((ys * width + xs)[inside])
+            pixelStamps.append(np.broadcast_to(stamps[positions][:, None], inside.shape)[inside])
+            alphas.append(np.broadcast_to(kernel, inside.shape)[inside])
+
+        pixels, pixelStamps, alphas = np.concatenate(pixels), np.concatenate(pixelStamps), np.concatenate(alphas)
+
+        if blendMode == "max":
+            np.maximum.at(alpha, pixels, alphas)
+        else:
+            # A stamp covers each of its pixels once, so the highest stamp number per pixel is its last write
+            np.maximum.at(lastStamp, pixels, pixelStamps)
+            last = lastStamp[pixels] == pixelStamps
+            alpha[pixels[last]] = alphas[last]
+
+        start = stop
+
+
+def saveImage(image: np.ndarray, path: str) -> None:
+    """Write an RGBA image as PNG, one pixel of the file per pixel of the array"""
+    Image.fromarray(image, "RGBA").save(path, format="png", compress_level=PNG_COMPRESS_LEVEL)
+
+
 def calculateAlpha(distance: float, maxDistance: float) -> int:
     minAlpha = 5
     maxAlpha = 255
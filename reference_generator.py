@@ -1,15 +1,23 @@
+import os
 import sys
+import time
+from multiprocessing import Pool
 from pathlib import Path
 
-from image.reference_image import EdgeMatrixCreator
+from genetics.classes import JsonReference, NpyReference
+from image.reference_image import createReference
 
 main_directory = Path(__file__).resolve().parent
 outPath = f"{main_directory}/__out"
+cachePath = f"{outPath}/.cache/edges"
+imageExtensions = (".jpg", ".jpeg", ".png")
 
 
 def main():
     if len(sys.argv) < 2:
         print("Usage: python reference_generator.py [filepath] [?cannySigma] [?blurSigma]")
+        print("       python reference_generator.py [directory]/reference.json")
+        print("       python reference_generator.py --all [?cannySigma] [?blurSigma]")
         sys.exit(1)
 
     # Required
@@ -26,24 +34,47 @@ def main():
     except IndexError:
         pass
 
-    inputPath = f"{outPath}/{filepath}"
+    if filepath == "--all":
+        createAllReferences(cannySigma, blur, blurSigma)
+        return
 
-    name, extension = filepath.split(".")
-    outputFilepath = f"{name}_em.{extension}"
-    outputPath = f"{outPath}/{outputFilepath}"
+    inputPath = f"{outPath}/{filepath}"
 
-    dirName = filepath.split("/")
-    referenceOutputPath = f"{outPath}/{dirName[0]}/reference.json"
+    # References generated before the binary format are converted in place
+    if filepath.endswith("reference.json"):
+        NpyReference.fromReference(JsonReference(inputPath), str(Path(inputPath).with_suffix(".npy")))
+        return
 
-    directoryPath = Path(inputPath)
+    imagePath = Path(inputPath)
 
-    if not directoryPath.exists() or not directoryPath.is_file():
+    if not imagePath.exists() or not imagePath.is_file():
         print(f"Not a file {outPath}/{filepath}")
         sys.exit(1)
 
-    referenceGenerator = EdgeMatrixCreator(Path(inputPath), Path(outputPath))
-    referenceGenerator.createEdgeMatrix(cannySigma, blur, blurSigma)
-    referenceGenerator.createReferenceJson(Path(referenceOutputPath))
+    createReference(imagePath, cannySigma, blur, blurSigma, cachePath)
+
+
+def createAllReferences(cannySigma: float, blur: bool, blurSigma: float):
+    """References of every image under __out, one per directory, generated by a process pool"""
+    imagePaths = []
+    for directory in sorted(Path(outPath).iterdir()):
+        if not directory.is_dir() or directory.name.startswith("."):
+            continue
+
+        for path in sorted(directory.iterdir()):
+            if path.suffix.lower() in imageExtensions and not path.stem.endswith("_em"):
+                imagePaths.append(path)
+                break
+
+    start = time.time()
+    with Pool(processes=min(len(imagePaths), os.cpu_count() or 1) or 1) as pool:
+        referencePaths = pool.starmap(createReference, [
+            (imagePath, cannySigma, blur, blurSigma, cachePath) for imagePath in imagePaths
+        ])
+
+    for referencePath in referencePaths:
+        print(referencePath)
+    print(f"time: {time.time() - start}")
 
 
 if __name__ == "__main__":
@@ -21,7 +21,7 @@ import cv2 as cv
 import numpy as np
 from skimage import io
 
-from genetics.classes import JsonMainAgentStateAdapter
+from genetics.classes import RunLogMainAgentStateAdapter
 from ratings.utils import benford
 from ratings.utils import fractal_dimension
 
@@ -125,9 +125,11 @@ def baseTest(testImageName: str, configValues: dict, prefix: str):
     subprocess.Popen(["python", "genetic_algorithm.py", testImageName, prefix]).wait()
 
 
-def createImage(testImageName: str, version: str, minEvaluation: float):
-    # run output_image_generator.py with the given arguments
-    subprocess.Popen(["python", "output_image_generator.py", testImageName, version, '1', f'{minEvaluation:.2f}', '1']).wait()
+def createImages(testImageName: str, version: str, minEvaluations: list):
+    # run output_image_generator.py once, it renders the images of every minEvaluation in a single pass
+    minEvaluationsArgument = ','.join(f'{minEvaluation:.2f}' for minEvaluation in minEvaluations)
+    subprocess.Popen(["python", "output_image_generator.py", testImageName, version, '1', minEvaluationsArgument,
+                      '1']).wait()
 
 
 def removeImage(imagePath: str):
@@ -148,8 +150,9 @@ def benfordAndFractal(testImageName: str):
         if testName == "deepCrossover":
             continue
 
+        createImages(testImageName, imageDir, minEvaluations)
+
         for minEvaluation in minEvaluations:
-            createImage(testImageName, imageDir, minEvaluation)
             imagePath = f"/Users/michalryngier/studia/praca-magisterska/art/__out/{testImageName}/{imageDir}/images-{minEvaluation}/0.png"
 
             benfordValue = evaluateBenfordForImage(imagePath)
@@ -189,16 +192,21 @@ def agentsEvaluationAcrossIterations(metricName: str, metricKey: str):
             metricValue = config[metricKey]
             imageName = folder.split('/')[-2]
 
-            stateAdapter = JsonMainAgentStateAdapter(folder, '', True)
+            stateAdapter = RunLogMainAgentStateAdapter(folder, '', True)
+            numberOfSnapshots = int(config["iterations"] / config["savingFreq"]) + 1
+
+            # Only the evaluations are read, genomes are never decoded
+            for snapshot in stateAdapter.readSnapshots(("e",)):
+                if snapshot["index"] >= numberOfSnapshots:
+                    break
 
-            for i in range(int(config["iterations"] / config["savingFreq"]) + 1):
-                for agent in stateAdapter.load(i):
+                for evaluation in snapshot["e"]:
                     csvWriter.writerow({
                         'imageName': imageName,
                         'metricKey': metricKey,
                         'metricValue': f'{metricValue:.8f}',
-                        'agentEvaluation': f'{agent.getEvaluationValue():.8f}',
-                        'iteration': i * config["savingFreq"]
+                        'agentEvaluation': f'{evaluation:.8f}',
+                        'iteration': snapshot["index"] * config["savingFreq"]
                     })
 
 
@@ -0,0 +1,12 @@
+import numpy as np
+import pytest
+
+from genetics.classes import NpyReference
+
+
+@pytest.fixture
+def reference(tmp_path) -> NpyReference:
+    """Seeded 80 by 60 uint8 reference, dark enough that curves inside it score well above 0"""
+    values = np.random.default_rng(3).integers(0, 32, (60, 80), dtype=np.uint8)
+
+    return NpyReference.create(str(tmp_path / "reference.npy"), values)
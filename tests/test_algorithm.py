@@ -0,0 +1,58 @@
+import random
+from typing import List
+
+import numpy as np
+
+from genetics.basics import Agent, AlgorithmStateAdapter, Mutator
+from genetics.classes import ClosePositionMainAgentFactory
+from genetics.noise_algorithm.algorithm import NoiseAlgorithm, evaluateAgent
+from genetics.noise_algorithm.crosser import NoiseCrosser
+from genetics.noise_algorithm.fitness_function import NoiseFitnessFunction
+
+
+class ListStateAdapter(AlgorithmStateAdapter):
+    __snapshots: List[List[Agent]]
+
+    def __init__(self):
+        self.__snapshots = []
+
+    def setState(self, state: List[Agent]) -> None:
+        self.__snapshots = [state]
+
+    def hasState(self) -> bool:
+        return len(self.__snapshots) > 0
+
+    def load(self, index: int = None) -> List[Agent]:
+        return self.__snapshots[-1 if index is None else index]
+
+    def save(self, data: List[Agent], generation: int = None) -> None:
+        self.__snapshots.append(data)
+
+
+class ZeroPointMutator(Mutator):
+    """Appends a point at (0, 0), the genome only grows by zero alleles"""
+
+    def mutate(self, agent: Agent) -> None:
+        agent.setGeneticRepresentation(agent.getGeneticRepresentation() + '0' * 2 * agent.getAlleleLength())
+
+    def checkIfMutateAgentBit(self, agent: Agent) -> bool:
+        return False
+
+
+def test_length_only_change_is_evaluated_again(reference):
+    """Scores of agents whose genome only grew by zero alleles are not reused"""
+    random.seed(4)
+    config = {"iterations": 2, "savingFreq": 10, "populationSize": 40}
+    factory = ClosePositionMainAgentFactory(reference.xMax(), reference.yMax(), 1, 3, 1, 3, 16, 30, 10)
+    stateAdapter = ListStateAdapter()
+    algorithm = NoiseAlgorithm(reference, stateAdapter, NoiseCrosser(0, 1), ZeroPointMutator(), factory, config,
+                               None)
+    algorithm.addFitnessFunction(NoiseFitnessFunction(), 1)
+
+    algorithm.run()
+    algorithm.save()
+
+    agents = stateAdapter.load()
+    expected = [evaluateAgent(agent.clone(), [NoiseFitnessFunction()], [1], reference) for agent in agents]
+    assert all(agent.getLength() >= 4 * 2 * 16 for agent in agents) and np.count_nonzero(expected) > 0
+    assert np.allclose([agent.getEvaluationValue() for agent in agents], expected, rtol=1e-12, atol=0)
@@ -0,0 +1,88 @@
+import random
+
+import numpy as np
+
+from genetics.basics import Agent, Point, Reference, createSummedAreaTable
+from genetics.classes import ClosePositionMainAgentFactory
+
+
+class ArrayReference(Reference):
+    """Implements only the scalar methods, the batch ones come from the defaults"""
+
+    def __init__(self, values: np.ndarray):
+        self.values = values
+
+    def getValueOnPoint(self, point: Point, threshold: int = 0) -> float:
+        return float(self.values[point.getY(), point.getX()]) * max(threshold, 1)
+
+    def setValueOnPoint(self, value: float, point: Point) -> None:
+        self.values[point.getY(), point.getX()] = value
+
+    def xMax(self) -> int:
+        return self.values.shape[1] - 1
+
+    def yMax(self) -> int:
+        return self.values.shape[0] - 1
+
+
+class CurveAgent(Agent):
+    """Delegates the scalar methods to a MainAgent, getPoints comes from the default"""
+
+    def __init__(self, agent: Agent):
+        self.agent = agent
+
+    def getPointForT(self, t: float) -> Point:
+        return self.agent.getPointForT(t)
+
+    def getStep(self) -> float:
+        return self.agent.getStep()
+
+    def setStep(self, step: float) -> None:
+        self.agent.setStep(step)
+
+    def getThreshold(self) -> int:
+        return self.agent.getThreshold()
+
+    def getEvaluationValue(self) -> float:
+        return self.agent.getEvaluationValue()
+
+    def setEvaluationValue(self, value: float) -> None:
+        self.agent.setEvaluationValue(value)
+
+    def getLength(self) -> int:
+        return self.agent.getLength()
+
+    def getGeneticRepresentation(self) -> str:
+        return self.agent.getGeneticRepresentation()
+
+    def setGeneticRepresentation(self, geneticRepresentation: str) -> None:
+        self.agent.setGeneticRepresentation(geneticRepresentation)
+
+    def clone(self) -> "Agent":
+        return CurveAgent(self.agent.clone())
+
+    def getAlleleLength(self) -> int:
+        return self.agent.getAlleleLength()
+
+    def setAlleleLength(self, length: int) -> None:
+        self.agent.setAlleleLength(length)
+
+    def toDictionary(self) -> {}:
+        return self.agent.toDictionary()
+
+
+def test_reference_defaults_fall_back_to_getValueOnPoint():
+    values = np.random.default_rng(1).random((7, 9))
+    reference = ArrayReference(values)
+    xs, ys = np.array([[0, 8], [3, 4]]), np.array([[0, 6], [2, 5]])
+
+    assert np.array_equal(reference.getValues(), values)
+    assert np.array_equal(reference.getSummedAreaTable(), createSummedAreaTable(values))
+    assert np.array_equal(reference.getValuesOnPoints(xs, ys, np.array(2)), values[ys, xs] * 2)
+
+
+def test_agent_getPoints_falls_back_to_getPointForT():
+    random.seed(1)
+    agent = ClosePositionMainAgentFactory(100, 100, 0, 6, 1, 1, 8, 40, 10).create()
+
+    assert np.array_equal(CurveAgent(agent).getPoints(), agent.getPoints())
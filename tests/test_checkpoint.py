@@ -0,0 +1,87 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from genetics.checkpoint import Checkpoint
+from genetics.classes import ClosePositionMainAgentFactory, JsonMainAgentStateAdapter, NpzMainAgentStateAdapter, \
+    RunLogMainAgentStateAdapter
+from genetics.noise_algorithm.algorithm import NoiseAlgorithm
+from genetics.noise_algorithm.crosser import NoiseCrosser
+from genetics.noise_algorithm.fitness_function import NoiseFitnessFunction
+from genetics.noise_algorithm.mutator import NoiseMutator
+
+STATE_ADAPTERS = {"json": JsonMainAgentStateAdapter, "npz": NpzMainAgentStateAdapter,
+                  "log": RunLogMainAgentStateAdapter}
+
+
+class Crash(Exception):
+    pass
+
+
+def createCrashingAdapter(adapterClass, crashGeneration: int):
+    """The adapter class raising right after the first snapshot of crashGeneration or later is saved"""
+
+    def save(self, data, generation=None):
+        adapterClass.save(self, data, generation)
+        if generation >= crashGeneration:
+            raise Crash()
+
+    return type(f"Crashing{adapterClass.__name__}", (adapterClass,), {"save": save})
+
+
+def getCheckpointPath(directory) -> str:
+    # Outside of the state files, like the checkpoint directory genetic_algorithm.py uses
+    return str(directory / "checkpoint" / "checkpoint.npz")
+
+
+def runAlgorithm(reference, directory, adapterClass, crossoverMode: str, checkpoint: Checkpoint = None) -> None:
+    config = {"iterations": 12, "savingFreq": 2, "checkpointFreq": 3, "populationSize": 40,
+              "crossoverMode": crossoverMode, "mutationMode": crossoverMode}
+    factory = ClosePositionMainAgentFactory(reference.xMax(), reference.yMax(), 1, 4, 1, 3, 16, 30, 10)
+    algorithm = NoiseAlgorithm(reference, adapterClass(str(directory), "x"), NoiseCrosser(0.7, 3),
+                               NoiseMutator(0.01, 3), factory, config, None, getCheckpointPath(directory))
+    algorithm.addFitnessFunction(NoiseFitnessFunction(), 1)
+    if checkpoint is not None:
+        algorithm.resume(checkpoint)
+
+    algorithm.run()
+    algorithm.save()
+
+
+def readRun(directory, adapterClass) -> tuple:
+    """Snapshots in any order, json file names of one second do not keep their order, and the histograms"""
+    stateAdapter = adapterClass(str(directory), "x")
+    snapshots = []
+    while agents := stateAdapter.load(len(snapshots)):
+        snapshots.append(json.dumps([agent.toDictionary() for agent in agents]))
+
+    with open(directory / "histograms.csv") as histogramFile:
+        return sorted(snapshots), histogramFile.read()
+
+
+@pytest.mark.parametrize("stateFormat", STATE_ADAPTERS)
+@pytest.mark.parametrize("crossoverMode", ["agent", "population"])
+def test_resumed_run_matches_uninterrupted_run(reference, tmp_path, stateFormat, crossoverMode):
+    adapterClass = STATE_ADAPTERS[stateFormat]
+    uninterrupted, resumed = tmp_path / "uninterrupted", tmp_path / "resumed"
+    uninterrupted.mkdir()
+    resumed.mkdir()
+
+    random.seed(5)
+    np.random.seed(5)
+    runAlgorithm(reference, uninterrupted, adapterClass, crossoverMode)
+
+    random.seed(5)
+    np.random.seed(5)
+    with pytest.raises(Crash):
+        runAlgorithm(reference, resumed, createCrashingAdapter(adapterClass, 8), crossoverMode)
+
+    # The random states come from the checkpoint, not from the seed
+    random.seed(6)
+    np.random.seed(6)
+    runAlgorithm(reference, resumed, adapterClass, crossoverMode, Checkpoint.load(getCheckpointPath(resumed)))
+
+    assert readRun(resumed, adapterClass) == readRun(uninterrupted, adapterClass)
+    assert len(readRun(resumed, adapterClass)[0]) == 7
@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+import pytest
+
+from genetics.basics import Crosser
+from genetics.classes import ClosePositionMainAgentFactory, MainAgentPopulation
+from genetics.noise_algorithm.crosser import NoiseCrosser
+
+
+def createPopulation(seed: int, alleleLength: int, pointsMin: int, pointsMax: int) -> MainAgentPopulation:
+    random.seed(seed)
+    coordinateMax = min(255, 2 ** alleleLength - 1)
+    factory = ClosePositionMainAgentFactory(coordinateMax, coordinateMax, pointsMin, pointsMax, 0, 3, alleleLength,
+                                            150, 20)
+    agents = [factory.create() for _ in range(60)]
+    for agent in agents:
+        agent.setEvaluationValue(random.random())
+
+    return MainAgentPopulation.fromAgents(agents)
+
+
+@pytest.mark.parametrize("alleleLength", [64, 16, 7])
+@pytest.mark.parametrize("pointsMinMax", [(1, 1), (2, 20), (0, 5)])
+@pytest.mark.parametrize("crossoverPoints", [1, 2, 3, 4])
+def test_bulk_crossover_matches_pair_by_pair(alleleLength, pointsMinMax, crossoverPoints):
+    """The packed crossover draws like the pair by pair stage, a seeded run gives the same genomes"""
+    crosser = NoiseCrosser(0.7, crossoverPoints)
+    scalar = createPopulation(1, alleleLength, *pointsMinMax).getAgents()
+    bulk = createPopulation(1, alleleLength, *pointsMinMax).getAgents()
+    before = [agent.getGeneticRepresentation() for agent in bulk]
+
+    random.seed(2)
+    Crosser.crossoverPopulation(crosser, scalar)
+    random.seed(2)
+    crosser.crossoverPopulation(bulk)
+
+    assert [agent.getGeneticRepresentation() for agent in bulk] \
+        == [agent.getGeneticRepresentation() for agent in scalar]
+    assert [agent.getGeneticRepresentation() for agent in bulk] != before
+    assert np.array_equal([agent.getLength() for agent in bulk], [agent.getLength() for agent in scalar])
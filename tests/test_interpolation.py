@@ -0,0 +1,38 @@
+import random
+
+import pytest
+
+from genetics.classes import ClosePositionMainAgentFactory, MainAgent, MainAgentPopulation, _getInterpolationTs
+
+
+def createAgents(seed: int, numberOfInterpolationPoints: int):
+    random.seed(seed)
+    factory = ClosePositionMainAgentFactory(40, 40, 0, 8, 1, 1, 8, numberOfInterpolationPoints, 5)
+
+    return MainAgentPopulation.fromAgents([factory.create() for _ in range(400)]).getAgents()
+
+
+@pytest.mark.parametrize("numberOfInterpolationPoints", [10, 60, 150])
+def test_batch_sampling_matches_point_by_point(numberOfInterpolationPoints):
+    """Bernstein batch sampling rounds to the same points as the de Casteljau getPointForT"""
+    agents = createAgents(6, numberOfInterpolationPoints)
+    ts = _getInterpolationTs(numberOfInterpolationPoints)
+
+    for agent in agents:
+        expected = [(point.getX(), point.getY()) for point in map(agent.getPointForT, ts)]
+        assert [tuple(point) for point in agent.getPoints().tolist()] == expected
+
+
+@pytest.mark.parametrize("controlPoints, tIndex", [
+    ([(80, 117), (180, 117), (251, 192), (156, 29), (22, 189)], 25),
+    ([(211, 184), (163, 31), (253, 83), (102, 173), (3, 12)], 25),
+    ([(162, 72), (166, 116), (27, 0), (247, 112), (38, 0)], 45),
+])
+def test_batch_sampling_resolves_rounding_ties(controlPoints, tIndex):
+    """Curves whose Bernstein sample at tIndex rounds the other way than de Casteljau without the fallback"""
+    start, *inner, end = controlPoints
+    agent = MainAgent(150, 1, 8, ''.join(format(coordinate, '08b') for point in [start, end, *inner]
+                                         for coordinate in point))
+    point = agent.getPointForT(_getInterpolationTs(150)[tIndex])
+
+    assert tuple(agent.getPoints()[tIndex]) == (point.getX(), point.getY())
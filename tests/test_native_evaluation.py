@@ -0,0 +1,51 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+import genetics.classes
+from genetics.classes import ClosePositionMainAgentFactory, JsonReference, MainAgentPopulation, \
+    evaluateCurvesNative, hasNativeEvaluation, interpolateAgents
+from genetics.noise_algorithm.fitness_function import NoiseFitnessFunction
+
+
+def createAgents(reference, numberOfInterpolationPoints: int):
+    random.seed(numberOfInterpolationPoints)
+    factory = ClosePositionMainAgentFactory(reference.xMax(), reference.yMax(), 0, 6, 1, 5, 16,
+                                            numberOfInterpolationPoints, 10)
+
+    return MainAgentPopulation.fromAgents([factory.create() for _ in range(300)]).getAgents()
+
+
+@pytest.fixture
+def jsonReference(tmp_path, reference) -> JsonReference:
+    path = tmp_path / "reference.json"
+    with open(path, 'w') as file:
+        json.dump({"xMax": reference.xMax(), "yMax": reference.yMax(),
+                   "pointsValues": (reference.getStoredValues() / 255).tolist()}, file)
+
+    return JsonReference(str(path))
+
+
+@pytest.mark.skipif(not hasNativeEvaluation(), reason="interpolate.so does not export evaluateCurves")
+@pytest.mark.parametrize("numberOfInterpolationPoints", [7, 49, 60])
+@pytest.mark.parametrize("referenceName", ["reference", "jsonReference"])
+def test_native_kernel_matches_numpy(numberOfInterpolationPoints, referenceName, request):
+    """Both the uint8 and the float reference kernels give the numpy scores bit for bit"""
+    reference = request.getfixturevalue(referenceName)
+    agents = createAgents(reference, numberOfInterpolationPoints)
+    fitnessFunction = NoiseFitnessFunction()
+
+    native = fitnessFunction.evaluateNative(agents, reference)
+    batch = fitnessFunction.evaluateBatch(agents, interpolateAgents(agents), reference)
+
+    assert np.count_nonzero(batch) > 0
+    assert np.array_equal(native, batch)
+
+
+def test_missing_kernel_raises(reference, monkeypatch):
+    monkeypatch.setattr(genetics.classes, "evaluate_curves_function", None)
+
+    with pytest.raises(RuntimeError):
+        evaluateCurvesNative(createAgents(reference, 7), reference)
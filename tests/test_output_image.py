@@ -0,0 +1,68 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from genetics.classes import ClosePositionMainAgentFactory, MainAgentPopulation
+from output_image_generator import calculateAlpha, createImage, createImages
+
+WIDTH, HEIGHT = 60, 50
+
+
+def createAgents():
+    random.seed(8)
+    factory = ClosePositionMainAgentFactory(WIDTH, HEIGHT, 0, 4, 0, 5, 16, 40, 15)
+    agents = MainAgentPopulation.fromAgents([factory.create() for _ in range(40)]).getAgents()
+    for agent in agents:
+        agent.setEvaluationValue(random.random())
+
+    return agents
+
+
+def drawImagePixelByPixel(width: int, height: int, agents, minEvaluation: float, scale: int) -> np.ndarray:
+    """The per-pixel loop the stamp rasterizer replaced, the last pixel written wins"""
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[:, :, :3] = 255
+    image[:, :, 3] = 255
+
+    for agent in agents:
+        if agent.getEvaluationValue() < minEvaluation:
+            continue
+
+        step = agent.getStep()
+        threshold = math.floor((agent.getThreshold() * scale) / 2)
+        maxDistance = threshold * math.sqrt(2)
+
+        for t in np.arange(0, 1 + step, step):
+            point = agent.getPointForT(t)
+            x, y = point.getX() * scale, point.getY() * scale
+
+            for yy in range(max(0, y - threshold), min(height, y + threshold + 1)):
+                for xx in range(max(0, x - threshold), min(width, x + threshold + 1)):
+                    distance = math.sqrt((x - xx) ** 2 + (y - yy) ** 2)
+                    alpha = int(calculateAlpha(distance, maxDistance)) if distance > 0 else 255
+                    image[yy][xx] = (0, 0, 0, alpha)
+
+    return image
+
+
+@pytest.mark.parametrize("scale", [1, 2])
+@pytest.mark.parametrize("minEvaluation", [0.0, 0.5])
+def test_stamps_match_pixel_by_pixel_drawing(scale, minEvaluation):
+    agents = createAgents()
+    width, height = WIDTH * scale, HEIGHT * scale
+    expected = drawImagePixelByPixel(width, height, agents, minEvaluation, scale)
+
+    assert (expected[:, :, 0] == 0).sum() > width * height // 10
+    assert np.array_equal(createImage(width, height, agents, minEvaluation, scale), expected)
+
+
+@pytest.mark.parametrize("scale", [1, 2])
+def test_images_of_several_minEvaluations_match_single_images(scale):
+    agents = createAgents()
+    width, height = WIDTH * scale, HEIGHT * scale
+    images = createImages(width, height, agents, [0.0, 0.5], scale)
+
+    for image, minEvaluation in zip(images, [0.0, 0.5]):
+        assert np.array_equal(image, drawImagePixelByPixel(width, height, agents, minEvaluation, scale))
@@ -0,0 +1,45 @@
+import random
+
+from genetics.classes import MainAgent, MainAgentPopulation
+from genetics.noise_algorithm.crosser import NoiseCrosser
+
+
+def createRepresentation(*coordinates: int) -> str:
+    return ''.join(format(coordinate, '08b') for coordinate in coordinates)
+
+
+SHORT = createRepresentation(5, 5, 10, 10)
+LONG = createRepresentation(5, 5, 10, 10, 0, 0)
+
+
+def getMiddle(agent: MainAgent) -> tuple:
+    point = agent.getPointForT(0.5)
+
+    return point.getX(), point.getY()
+
+
+def test_length_only_change_invalidates_curve():
+    """Zero alleles appended to a genome change its curve, the cached one must not be reused"""
+    population = MainAgentPopulation.fromAgents([MainAgent(4, 1, 8, SHORT), MainAgent(4, 1, 8, SHORT)])
+    agent = population.getAgents()[0]
+    assert getMiddle(agent) == (8, 8)
+
+    agent.setGeneticRepresentation(LONG)
+
+    assert population.getVersions()[0] != population.getVersions()[1]
+    assert getMiddle(agent) == getMiddle(MainAgent(4, 1, 8, LONG)) == (4, 4)
+
+
+def test_length_only_crossover_invalidates_curves():
+    """A crossover that swaps only the lengths of two rows changes both of their curves"""
+    population = MainAgentPopulation.fromAgents([MainAgent(4, 1, 8, SHORT), MainAgent(4, 1, 8, LONG)])
+    agents = population.getAgents()
+    for agent in agents:
+        agent.setEvaluationValue(1.0)
+
+    before = [getMiddle(agent) for agent in agents]
+    random.seed(0)
+    NoiseCrosser(1.0, 1).crossoverPopulation(agents)
+
+    assert [agent.getLength() for agent in agents] == [48, 32]
+    assert [getMiddle(agent) for agent in agents] == before[::-1]
@@ -0,0 +1,54 @@
+import random
+
+import numpy as np
+
+from genetics.classes import ClosePositionMainAgentFactory, MainAgentPopulation, RunLogMainAgentStateAdapter
+from genetics.noise_algorithm.mutator import NoiseMutator
+
+
+def createSnapshots(count: int) -> list:
+    """Seeded snapshots of one evolving population, some agents change, reorder or repeat between them"""
+    random.seed(7)
+    np.random.seed(7)
+    factory = ClosePositionMainAgentFactory(200, 200, 0, 5, 1, 3, 16, 30, 10)
+    agents = MainAgentPopulation.fromAgents([factory.create() for _ in range(50)]).getAgents()
+    mutator = NoiseMutator(0.02, 8)
+    snapshots = []
+
+    for _ in range(count):
+        for agent in agents:
+            agent.setEvaluationValue(random.random())
+        snapshots.append([agent.toDictionary() for agent in agents])
+
+        mutator.mutatePopulation(random.sample(agents, 10))
+        agents = random.sample(agents, len(agents) - 5) + agents[:5]
+
+    return snapshots
+
+
+def saveSnapshots(directory, snapshots: list, keyframeInterval: int) -> None:
+    directory.mkdir()
+    stateAdapter = RunLogMainAgentStateAdapter(str(directory), "x", keyframeInterval=keyframeInterval)
+    for generation, snapshot in enumerate(snapshots):
+        population = MainAgentPopulation.fromGeneticRepresentations(
+            [agent["g"] for agent in snapshot], [agent["t"] for agent in snapshot],
+            [agent["n"] for agent in snapshot], [agent["e"] for agent in snapshot], 16)
+        stateAdapter.save(population.getAgents(), generation)
+    stateAdapter.close()
+
+
+def test_delta_snapshots_load_like_keyframes(tmp_path):
+    snapshots = createSnapshots(8)
+    saveSnapshots(tmp_path / "deltas", snapshots, 3)
+    saveSnapshots(tmp_path / "keyframes", snapshots, 1)
+    deltas = RunLogMainAgentStateAdapter(str(tmp_path / "deltas"), "x")
+    keyframes = RunLogMainAgentStateAdapter(str(tmp_path / "keyframes"), "x")
+
+    # Backwards as well, a delta may not be rebuilt from the snapshot loaded before it
+    for index in [*range(8), *reversed(range(8))]:
+        loaded = [agent.toDictionary() for agent in deltas.load(index)]
+        assert loaded == [agent.toDictionary() for agent in keyframes.load(index)] == snapshots[index]
+
+    assert [snapshot["g"] for snapshot in deltas.readSnapshots(("g", "e"))] \
+        == [snapshot["g"] for snapshot in keyframes.readSnapshots(("g", "e"))]
+    assert deltas.load(8) == []
@@ -0,0 +1,47 @@
+import pickle
+import random
+
+import numpy as np
+
+import genetics.shared_memory
+from genetics.classes import ClosePositionMainAgentFactory
+from genetics.noise_algorithm.algorithm import evaluateAgentsBatch
+from genetics.noise_algorithm.fitness_function import NoiseFitnessFunction
+from genetics.shared_memory import SharedMemoryExecutor, SharedPopulation
+
+
+def createAgents(reference, pointsMax: int, count: int = 60):
+    factory = ClosePositionMainAgentFactory(reference.xMax(), reference.yMax(), 0, pointsMax, 1, 3, 16, 30, 10)
+
+    return [factory.create() for _ in range(count)]
+
+
+def test_worker_unmaps_arrays_of_replaced_populations(tmp_path, reference):
+    random.seed(9)
+    first, second = SharedPopulation(str(tmp_path), 60, 6, 16), SharedPopulation(str(tmp_path), 60, 18, 16)
+    first.write(createAgents(reference, 1))
+    second.write(createAgents(reference, 7))
+
+    # Unpickled like in a worker, where the arrays are attached by path
+    pickle.loads(pickle.dumps(first)).getPopulation()
+    firstPaths = set(genetics.shared_memory._attachedArrays)
+    first.remove()
+    pickle.loads(pickle.dumps(second)).getPopulation()
+
+    assert len(firstPaths) == 5
+    assert not firstPaths & set(genetics.shared_memory._attachedArrays)
+    assert len(genetics.shared_memory._attachedArrays) == 5
+
+
+def test_executor_evaluates_growing_populations_like_one_process(reference):
+    random.seed(10)
+    executor = SharedMemoryExecutor(2)
+    try:
+        # Longer genomes make the executor replace its shared population
+        for pointsMax in (1, 4, 9):
+            agents = createAgents(reference, pointsMax)
+            shared = executor.evaluate(agents, evaluateAgentsBatch, [NoiseFitnessFunction()], [1], reference, 16)
+
+            assert np.array_equal(shared, evaluateAgentsBatch(agents, [NoiseFitnessFunction()], [1], reference))
+    finally:
+        executor.close()